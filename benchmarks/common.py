@@ -0,0 +1,134 @@
+"""Helpers shared by the benchmark scripts: a throwaway Postgres, latency stats and result files."""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.insert(0, ROOT)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def throwaway_postgres() -> Iterator[str]:
+    """Yield the URL of a migrated, empty Postgres that is thrown away afterwards.
+
+    BENCH_DATABASE_URL points the benchmarks at an existing database instead; it is migrated
+    and written to, so it must be disposable. Otherwise a temporary cluster is started with
+    the initdb/pg_ctl found on PATH.
+    """
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url:
+        migrate(url)
+        yield url
+        return
+
+    if not (shutil.which("initdb") and shutil.which("pg_ctl")):
+        raise SystemExit("initdb/pg_ctl not found on PATH: install PostgreSQL or set BENCH_DATABASE_URL")
+
+    workdir = tempfile.mkdtemp(prefix="bench-pg-")
+    data = os.path.join(workdir, "data")
+    port = free_port()
+    try:
+        subprocess.run(["initdb", "-D", data, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        options = f"-p {port} -k {workdir} -c listen_addresses=127.0.0.1 {os.getenv('BENCH_PG_OPTIONS', '')}"
+        subprocess.run(["pg_ctl", "-D", data, "-o", options, "-l", os.path.join(workdir, "postgres.log"),
+                        "-w", "start"], check=True, stdout=subprocess.DEVNULL)
+        url = f"postgresql://bench@127.0.0.1:{port}/postgres"
+        migrate(url)
+        yield url
+    finally:
+        subprocess.run(["pg_ctl", "-D", data, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def database_env(url: str) -> Dict[str, str]:
+    return {
+        "DATABASE_URL": url,
+        "ASYNC_DATABASE_URL": url.replace("postgresql://", "postgresql+asyncpg://", 1),
+    }
+
+
+def use_database(url: str):
+    """Point the shared modules at `url`; must run before anything imports shared.database."""
+    os.environ.update(database_env(url))
+
+
+def migrate(url: str):
+    env = {**os.environ, **database_env(url)}
+    subprocess.run(["alembic", "upgrade", "head"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.run([sys.executable, "-m", "shared.partitions", "create"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(samples: List[float], elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency percentiles (in ms) for `samples` given in seconds."""
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "throughput_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def timed(fn, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(suite: str, config: dict, results: dict, output: Optional[str] = None) -> str:
+    """Write a machine-readable result file (see compare.py) and return its path."""
+    document = {
+        "suite": suite,
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "config": config,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{suite}-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    return output
@@ -0,0 +1,80 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 0.10]
+
+Latency metrics (p50/p95/p99) regress when they grow by more than --threshold, throughput when
+it drops by more than --threshold, and DB queries per request when they grow at all. The exit
+status is 1 when anything regressed, so the script can gate a release pipeline.
+"""
+from typing import Iterator, List, Tuple
+import argparse
+import json
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_KEY = "throughput_per_sec"
+QUERIES_KEY = "db_queries_per_request"
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def changes(baseline: dict, candidate: dict) -> Iterator[Tuple[str, str, float, float]]:
+    """(scenario, metric, old, new) for every metric present in both result sets."""
+    for scenario, old in baseline.items():
+        new = candidate.get(scenario)
+        if not isinstance(old, dict) or not isinstance(new, dict):
+            continue
+        # db_queries_per_request maps route -> queries; every other scenario maps metric -> value.
+        for metric, old_value in old.items():
+            new_value = new.get(metric)
+            if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)):
+                yield scenario, metric, old_value, new_value
+
+
+def is_regression(scenario: str, metric: str, old: float, new: float, threshold: float) -> bool:
+    if scenario == QUERIES_KEY:
+        return new > old
+    if metric in LATENCY_KEYS:
+        return old > 0 and (new - old) / old > threshold
+    if metric == THROUGHPUT_KEY:
+        return old > 0 and (old - new) / old > threshold
+    return False
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> List[str]:
+    regressions = []
+    for scenario, metric, old, new in changes(baseline["results"], candidate["results"]):
+        relevant = scenario == QUERIES_KEY or metric in LATENCY_KEYS or metric == THROUGHPUT_KEY
+        if not relevant:
+            continue
+        delta = f"{(new - old) / old:+.1%}" if old else "n/a"
+        regressed = is_regression(scenario, metric, old, new, threshold)
+        line = f"{scenario:45} {metric:20} {old:>12} {new:>12} {delta:>9}"
+        print(("REGRESSION " if regressed else "           ") + line)
+        if regressed:
+            regressions.append(f"{scenario} {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative change (0.10 = 10%%).")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    if baseline.get("suite") != candidate.get("suite"):
+        raise SystemExit(f"Different suites: {baseline.get('suite')} vs {candidate.get('suite')}")
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    regressions = compare(baseline, candidate, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        raise SystemExit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Local stand-in for the n8n agent webhook.
+
+Accepts the agent's webhook POST right away and, after --delay seconds (plus up to --jitter),
+calls the `answer_endpoint` from the payload back the way the real workflow does. With --stream
+the answer is POSTed in --chunks pieces, --chunk-interval seconds apart, like a streaming LLM.
+
+    python benchmarks/fake_n8n.py --port 5678 --delay 0.5 --jitter 0.2
+    python benchmarks/fake_n8n.py --stream --chunks 40 --chunk-interval 0.02
+"""
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Set
+import argparse
+import asyncio
+import random
+import httpx
+
+DELAY = 0.0
+JITTER = 0.0
+CALLBACK = True
+FAILURE_RATE = 0.0
+STREAM = False
+CHUNKS = 20
+CHUNK_INTERVAL = 0.02
+
+client: httpx.AsyncClient = None
+_callbacks: Set[asyncio.Task] = set()
+stats = {"received": 0, "answered": 0, "callback_errors": 0}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=500))
+    yield
+    await client.aclose()
+
+
+app = FastAPI(title="Fake n8n", lifespan=lifespan)
+
+
+async def tokens(text: str):
+    step = max(1, len(text) // CHUNKS)
+    for i in range(0, len(text), step):
+        yield text[i:i + step].encode()
+        await asyncio.sleep(CHUNK_INTERVAL)
+
+
+async def answer(payload: dict):
+    await asyncio.sleep(DELAY + random.uniform(0, JITTER))
+    text = f"Respuesta automática ({len(payload.get('prompt', ''))} caracteres de prompt)"
+    params = {"user_id": payload["user_id"], "client_code": payload["client_code"]}
+    try:
+        if STREAM:
+            response = await client.post(payload["answer_endpoint"], params=params, content=tokens(text * 10))
+        else:
+            response = await client.get(payload["answer_endpoint"], params={**params, "texto": text})
+        response.raise_for_status()
+        stats["answered"] += 1
+    except httpx.HTTPError:
+        stats["callback_errors"] += 1
+
+
+@app.post("/webhook")
+async def webhook(request: Request):
+    stats["received"] += 1
+    if FAILURE_RATE and random.random() < FAILURE_RATE:
+        return JSONResponse({"error": "simulated failure"}, status_code=503)
+    payload = await request.json()
+    if CALLBACK:
+        task = asyncio.create_task(answer(payload))
+        _callbacks.add(task)
+        task.add_done_callback(_callbacks.discard)
+    return {"status": "accepted"}
+
+
+@app.get("/stats")
+def get_stats():
+    return {**stats, "pending": len(_callbacks)}
+
+
+def main():
+    global DELAY, JITTER, CALLBACK, FAILURE_RATE, STREAM, CHUNKS, CHUNK_INTERVAL
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5678)
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds before answering.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay, up to this many seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of webhooks answered with 503.")
+    parser.add_argument("--no-callback", action="store_true", help="Accept webhooks without calling /answer.")
+    parser.add_argument("--stream", action="store_true", help="POST the answer as a chunked stream.")
+    parser.add_argument("--chunks", type=int, default=20, help="Pieces a streamed answer is split into.")
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="Seconds between streamed pieces.")
+    args = parser.parse_args()
+    DELAY, JITTER, FAILURE_RATE, CALLBACK = args.delay, args.jitter, args.failure_rate, not args.no_callback
+    STREAM, CHUNKS, CHUNK_INTERVAL = args.stream, args.chunks, args.chunk_interval
+
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
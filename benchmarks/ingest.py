@@ -0,0 +1,124 @@
+"""Question ingestion throughput: the GET path against the POST JSON, msgpack and batch bodies.
+
+Starts core and agent against a throwaway Postgres, with the fake n8n accepting webhooks without
+answering, then sends --requests questions per mode from --concurrency clients.
+
+    python benchmarks/ingest.py --requests 5000 --concurrency 50 --batch 100 --size 2000
+    python benchmarks/ingest.py get json_batch
+"""
+from typing import List
+import argparse
+import importlib.util
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import httpx
+
+from common import ROOT, database_env, free_port, summarize, throwaway_postgres, write_results
+from load import parse_env, seed, start_process, wait_ready
+
+MODES = ("get", "json", "msgpack", "json_batch", "msgpack_batch")
+
+
+def encode(mode: str, questions: List[dict]):
+    body = questions if mode.endswith("_batch") else questions[0]
+    if mode.startswith("msgpack"):
+        import msgpack
+        return msgpack.packb(body), "application/msgpack"
+    return json.dumps(body).encode(), "application/json"
+
+
+async def run_mode(mode: str, url: str, args) -> dict:
+    texto = "Pregunta de prueba " + "x" * args.size
+    per_request = args.batch if mode.endswith("_batch") else 1
+    samples = []
+    errors = 0
+    remaining = args.requests
+
+    async def worker(client: httpx.AsyncClient, i: int):
+        nonlocal remaining, errors
+        question = {"username": f"ingest-{i}", "client_code": f"bench-{i % args.clients}", "texto": texto}
+        while remaining > 0:
+            count = min(per_request, remaining)
+            remaining -= count
+            start = time.perf_counter()
+            try:
+                if mode == "get":
+                    response = await client.get(url, params=question)
+                else:
+                    content, content_type = encode(mode, [question] * count)
+                    response = await client.post(url, content=content, headers={"content-type": content_type})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    result = summarize(samples, elapsed, errors)
+    result["questions_per_sec"] = round(len(samples) * per_request / elapsed, 2) if elapsed else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modes", nargs="*", metavar="MODE", help=", ".join(MODES))
+    parser.add_argument("--requests", type=int, default=5000, help="Questions sent per mode.")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=100, help="Questions per request in the batch modes.")
+    parser.add_argument("--size", type=int, default=200, help="Extra characters of question text.")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--agent-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    modes = args.modes or list(MODES)
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+    if any(mode.startswith("msgpack") for mode in modes):
+        if importlib.util.find_spec("msgpack") is None:
+            raise SystemExit("msgpack modes need the msgpack package: pip install -r benchmarks/requirements.txt")
+
+    core_port, agent_port, n8n_port = free_port(), free_port(), free_port()
+    core_url, agent_url, n8n_url = (f"http://127.0.0.1:{port}" for port in (core_port, agent_port, n8n_port))
+    logdir = tempfile.mkdtemp(prefix="bench-logs-")
+
+    results = {}
+    with throwaway_postgres() as database_url:
+        env = {**os.environ, **database_env(database_url), "AGENT_PORT": str(agent_port)}
+        uvicorn = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--log-level", "warning"]
+        processes = [
+            start_process("core", uvicorn + ["--port", str(core_port)],
+                          os.path.join(ROOT, "services", "core"), env, logdir),
+            start_process("agent", uvicorn + ["--port", str(agent_port)],
+                          os.path.join(ROOT, "services", "agent"), {**env, **parse_env(args.agent_env)}, logdir),
+            start_process("fake_n8n", [sys.executable, os.path.join(ROOT, "benchmarks", "fake_n8n.py"),
+                                       "--port", str(n8n_port), "--no-callback"], ROOT, env, logdir),
+        ]
+        try:
+            for url, process in zip((core_url, agent_url, n8n_url), processes):
+                asyncio.run(wait_ready(f"{url}/docs", process))
+            asyncio.run(seed(core_url, n8n_url, args.clients))
+            for mode in modes:
+                print(f"Running {mode}...")
+                results[f"question_{mode}"] = asyncio.run(run_mode(mode, f"{agent_url}/question", args))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+        print(f"Service logs in {logdir}")
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("ingest", {**config, "modes": modes}, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
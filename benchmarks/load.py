@@ -0,0 +1,289 @@
+"""End-to-end load test: core + agent against a throwaway Postgres and the fake n8n webhook.
+
+Traffic, all running concurrently for --duration seconds after --warmup:
+  * --users    chat users: load the conversation via core, keep a WebSocket open, ask on
+               /question and wait for the answer the fake n8n posts back (end-to-end latency);
+  * --senders  fire-and-forget /question senders, no socket;
+  * --admins   admin users paging through the core list endpoints.
+
+Reports throughput and p50/p95/p99 per scenario plus SQL statements per request per route
+(from the services' /metrics), and writes them to benchmarks/results/ (see compare.py).
+
+    python benchmarks/load.py --users 50 --senders 200 --admins 5 --duration 60
+    python benchmarks/load.py --agent-env MESSAGE_WRITER=batched --output batched.json
+    python benchmarks/load.py --stream-answers      # also reports time to the first streamed delta
+"""
+from prometheus_client.parser import text_string_to_metric_families
+from typing import Dict, List, Optional
+import argparse
+import importlib.util
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+from common import ROOT, database_env, free_port, summarize, throwaway_postgres, write_results
+
+
+class Scenario:
+    def __init__(self):
+        self.samples: List[float] = []
+        self.errors = 0
+
+
+class LoadTest:
+    def __init__(self, args, core_url: str, agent_url: str):
+        self.args = args
+        self.core_url = core_url
+        self.agent_url = agent_url
+        self.recording = False
+        self.stopping = False
+        self.scenarios: Dict[str, Scenario] = {}
+        self.ws_messages = 0
+
+    def record(self, name: str, seconds: Optional[float]):
+        if not self.recording:
+            return
+        scenario = self.scenarios.setdefault(name, Scenario())
+        if seconds is None:
+            scenario.errors += 1
+        else:
+            scenario.samples.append(seconds)
+
+    async def _timed_get(self, client: httpx.AsyncClient, name: str, url: str, **params) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.record(name, None)
+            return None
+        self.record(name, time.perf_counter() - start)
+        return response
+
+    def _identity(self, i: int):
+        return f"bench-user-{i}", f"bench-{i % self.args.clients}"
+
+    async def _think(self):
+        if self.args.think:
+            await asyncio.sleep(random.uniform(0, self.args.think))
+
+    async def chat_user(self, client: httpx.AsyncClient, i: int):
+        import websockets
+
+        username, client_code = self._identity(i)
+        response = await self._timed_get(client, "load_conversation", f"{self.core_url}/load_conversation",
+                                         client_code=client_code, username=username)
+        if response is None:
+            return
+        user_id = response.json()["user_id"]
+
+        answers: asyncio.Queue = asyncio.Queue()
+        first_deltas: asyncio.Queue = asyncio.Queue()
+        ws_url = self.agent_url.replace("http://", "ws://") + f"/ws/{user_id}"
+        async with websockets.connect(ws_url) as ws:
+            async def read():
+                async for frame in ws:
+                    if frame == "ping":
+                        await ws.send("pong")
+                        continue
+                    self.ws_messages += 1
+                    event = json.loads(frame)
+                    if event.get("type") == "answer_delta" and first_deltas.empty():
+                        first_deltas.put_nowait(time.perf_counter())
+                    elif event.get("role") == "agent":
+                        answers.put_nowait(time.perf_counter())
+
+            reader = asyncio.create_task(read())
+            try:
+                while not self.stopping:
+                    for queue in (answers, first_deltas):
+                        while not queue.empty():
+                            queue.get_nowait()
+                    start = time.perf_counter()
+                    if await self._timed_get(client, "question", f"{self.agent_url}/question",
+                                             username=username, client_code=client_code,
+                                             texto=f"Pregunta de prueba {random.randint(1, 10 ** 6)}"):
+                        try:
+                            answered = await asyncio.wait_for(answers.get(), self.args.answer_timeout)
+                            self.record("answer_end_to_end", answered - start)
+                            if not first_deltas.empty():
+                                self.record("answer_first_delta", first_deltas.get_nowait() - start)
+                        except asyncio.TimeoutError:
+                            self.record("answer_end_to_end", None)
+                    await self._think()
+            finally:
+                reader.cancel()
+
+    async def sender(self, client: httpx.AsyncClient, i: int):
+        username, client_code = self._identity(self.args.users + i)
+        while not self.stopping:
+            await self._timed_get(client, "question", f"{self.agent_url}/question",
+                                  username=username, client_code=client_code, texto="Pregunta sin socket")
+            await self._think()
+
+    async def admin(self, client: httpx.AsyncClient, i: int):
+        paths = ["/clients", "/users", f"/clients/bench-{i % self.args.clients}/users", "/settings", "/templates"]
+        while not self.stopping:
+            for path in paths:
+                await self._timed_get(client, "admin_list", f"{self.core_url}{path}", limit=100)
+            await self._think()
+
+    async def run(self) -> Dict[str, dict]:
+        concurrency = self.args.users + self.args.senders + self.args.admins
+        limits = httpx.Limits(max_connections=concurrency + 10, max_keepalive_connections=concurrency + 10)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            tasks = [asyncio.create_task(self.chat_user(client, i)) for i in range(self.args.users)]
+            tasks += [asyncio.create_task(self.sender(client, i)) for i in range(self.args.senders)]
+            tasks += [asyncio.create_task(self.admin(client, i)) for i in range(self.args.admins)]
+
+            await asyncio.sleep(self.args.warmup)
+            services = {"core": self.core_url, "agent": self.agent_url}
+            before = await scrape(client, services)
+            self.recording = True
+            await asyncio.sleep(self.args.duration)
+            self.recording = False
+            after = await scrape(client, services)
+
+            self.stopping = True
+            await asyncio.wait(tasks, timeout=self.args.answer_timeout + 5)
+            for task in tasks:
+                task.cancel()
+
+        results = {name: summarize(s.samples, self.args.duration, s.errors) for name, s in self.scenarios.items()}
+        results["websocket"] = {"messages_received": self.ws_messages}
+        results["db_queries_per_request"] = queries_per_request(before, after)
+        return results
+
+
+async def scrape(client: httpx.AsyncClient, services: Dict[str, str]) -> Dict[str, float]:
+    """Sums and counts of db_queries_per_request, keyed "<service> <route>|sum" and "|count"."""
+    values = {}
+    for service, url in services.items():
+        text = (await client.get(f"{url}/metrics")).text
+        for family in text_string_to_metric_families(text):
+            if family.name != "db_queries_per_request":
+                continue
+            for sample in family.samples:
+                if sample.name.endswith(("_sum", "_count")):
+                    values[f"{service} {sample.labels['route']}|{sample.name.rsplit('_', 1)[1]}"] = sample.value
+    return values
+
+
+def queries_per_request(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    result = {}
+    for key in after:
+        route, kind = key.split("|")
+        if kind != "count":
+            continue
+        count = after[key] - before.get(key, 0)
+        if count > 0:
+            total = after[f"{route}|sum"] - before.get(f"{route}|sum", 0)
+            result[route] = round(total / count, 2)
+    return result
+
+
+def start_process(name: str, command: List[str], cwd: str, env: dict, logdir: str) -> subprocess.Popen:
+    log = open(os.path.join(logdir, f"{name}.log"), "w")
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"{url} exited with code {process.returncode}; see its log")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+async def seed(core_url: str, n8n_url: str, clients: int):
+    async with httpx.AsyncClient(timeout=60) as client:
+        body = "\n".join(json.dumps({"client_code": f"bench-{i}", "name": f"Cliente de prueba {i}"})
+                         for i in range(clients))
+        (await client.post(f"{core_url}/bulk/clients", content=body,
+                           headers={"content-type": "application/x-ndjson"})).raise_for_status()
+        for key, value in (("URL_AGENT", f"{n8n_url}/webhook"), ("URL_ANSWER_HOST", "http://127.0.0.1")):
+            (await client.post(f"{core_url}/settings",
+                               json={"key": key, "value": value, "description": "benchmark"})).raise_for_status()
+
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+    return dict(pair.split("=", 1) for pair in pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--senders", type=int, default=0)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--think", type=float, default=0.0, help="Random pause between requests, up to N s.")
+    parser.add_argument("--answer-delay", type=float, default=0.2, help="Fake n8n delay before answering.")
+    parser.add_argument("--answer-jitter", type=float, default=0.1)
+    parser.add_argument("--answer-timeout", type=float, default=10)
+    parser.add_argument("--stream-answers", action="store_true", help="Fake n8n streams its answers.")
+    parser.add_argument("--agent-workers", type=int, default=1)
+    parser.add_argument("--core-workers", type=int, default=1)
+    parser.add_argument("--agent-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--core-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    if args.users:
+        # Checked up front, so a missing package fails before the stack is started.
+        if importlib.util.find_spec("websockets") is None:
+            raise SystemExit("Chat users need the websockets package: pip install -r benchmarks/requirements.txt")
+
+    core_port, agent_port, n8n_port = free_port(), free_port(), free_port()
+    core_url, agent_url, n8n_url = (f"http://127.0.0.1:{port}" for port in (core_port, agent_port, n8n_port))
+    logdir = tempfile.mkdtemp(prefix="bench-logs-")
+
+    with throwaway_postgres() as database_url:
+        env = {**os.environ, **database_env(database_url), "AGENT_PORT": str(agent_port)}
+        if args.agent_workers > 1:
+            # Sockets and the answers for them may land on different workers.
+            env.setdefault("BROADCAST_BACKEND", "postgres")
+        agent_env = {**env, **parse_env(args.agent_env)}
+        core_env = {**env, **parse_env(args.core_env)}
+
+        uvicorn = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--log-level", "warning"]
+        processes = [
+            start_process("core", uvicorn + ["--port", str(core_port), "--workers", str(args.core_workers)],
+                          os.path.join(ROOT, "services", "core"), core_env, logdir),
+            start_process("agent", uvicorn + ["--port", str(agent_port), "--workers", str(args.agent_workers)],
+                          os.path.join(ROOT, "services", "agent"), agent_env, logdir),
+            start_process("fake_n8n", [sys.executable, os.path.join(ROOT, "benchmarks", "fake_n8n.py"),
+                                       "--port", str(n8n_port), "--delay", str(args.answer_delay),
+                                       "--jitter", str(args.answer_jitter)]
+                          + (["--stream"] if args.stream_answers else []), ROOT, env, logdir),
+        ]
+        try:
+            for url, process in zip((core_url, agent_url, n8n_url), processes):
+                asyncio.run(wait_ready(f"{url}/docs", process))
+            asyncio.run(seed(core_url, n8n_url, args.clients))
+            results = asyncio.run(LoadTest(args, core_url, agent_url).run())
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+        print(f"Service logs in {logdir}")
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("load", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
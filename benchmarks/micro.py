@@ -0,0 +1,603 @@
+"""Microbenchmarks of individual hot-path pieces.
+
+    python benchmarks/micro.py                      # every benchmark
+    python benchmarks/micro.py prompt webhook       # only these
+
+  prompt   render the client context and build_prompt for 5, 50 and 500 attributes
+  large    1 MB prompts rendered inline / in a thread pool / in a process pool, with the
+           event loop's worst stall meanwhile, plus gzip and zstd payload compression
+  webhook  pooled webhook_client.post throughput against the fake n8n (no callbacks)
+  history  history_engine on a 10k-message conversation, cold and incremental   [Postgres]
+  writer   messages/sec of the direct and batched message writers               [Postgres]
+  lists    GET /clients and /users with 100k rows each, as JSON and NDJSON     [Postgres]
+  broadcast  round-trip a 50 KB message through the Postgres backend's NOTIFY chunking and
+           through the Redis backend against fakeredis; fails if it comes back altered
+  pool     a pool of 2+2 connections under 7 concurrent callers: the extra callers must
+           queue, and give up after pool_timeout rather than hang                [Postgres]
+  plans    EXPLAIN ANALYZE of the history and listing queries over 1M seeded messages,
+           failing if any of them scans a hot table sequentially                [Postgres]
+
+Benchmarks marked [Postgres] run against a throwaway database (see common.throwaway_postgres).
+Checks that fail (like a sequential scan in `plans`) are listed at the end and make the exit
+status 1, after the results are written.
+"""
+from contextlib import ExitStack
+from typing import Callable, Dict, Iterator, List, Tuple
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT, free_port, summarize, throwaway_postgres, timed, use_database, write_results
+
+sys.path.insert(0, os.path.join(ROOT, "services", "agent"))
+
+BENCHMARKS: Dict[str, Callable] = {}
+NEEDS_DATABASE = set()
+# Failed assertions of check-style benchmarks, reported once the results are written.
+FAILURES: List[str] = []
+
+
+def benchmark(name: str, database: bool = False):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        if database:
+            NEEDS_DATABASE.add(name)
+        return fn
+    return register
+
+
+@benchmark("prompt")
+def bench_prompt(args) -> dict:
+    from prompts import WebhookDispatch, build_prompt
+    from shared.context_cache import render_client_context
+
+    history = tuple(("user" if i % 2 else "agent", f"Mensaje de historial número {i} " * 4) for i in range(40))
+    results = {}
+    for count in (5, 50, 500):
+        attributes = [(f"Atributo {i}", f"Valor del atributo {i} para el cliente") for i in range(count)]
+        context = render_client_context("Cliente de prueba", attributes)
+        dispatch = WebhookDispatch(user_id=1, client_code="bench", webhook_url="", answer_endpoint="",
+                                   context=context, history=history)
+        render = timed(lambda: render_client_context("Cliente de prueba", attributes), args.repeat)
+        build = timed(lambda: build_prompt(dispatch), args.repeat)
+        results[f"render_context_{count}_attributes"] = summarize(render, sum(render))
+        results[f"build_prompt_{count}_attributes"] = summarize(build, sum(build))
+    return results
+
+
+async def _loop_lag(lags: list):
+    # Sleeps 1 ms at a time; anything beyond that is time the loop was blocked.
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+@benchmark("large")
+def bench_large_prompt(args) -> dict:
+    from prompts import WebhookDispatch, compress, render_payload
+
+    turn = "Mensaje largo del historial de la conversación con bastante detalle. " * 15
+    history = tuple(("user" if i % 2 else "agent", turn) for i in range(1024 * 1024 // len(turn)))
+    context = "\n".join(f"- Atributo {i}: Valor del atributo {i} para el cliente" for i in range(2000))
+    dispatch = WebhookDispatch(user_id=1, client_code="bench", webhook_url="", answer_endpoint="",
+                               context=context, history=history)
+
+    results = {f"render_1mb_{executor}": asyncio.run(_bench_large_prompt(dispatch, executor, args))
+               for executor in ("inline", "thread", "process")}
+
+    body = render_payload(dispatch, "none").body
+    for encoding in ("gzip", "zstd"):
+        try:
+            samples = timed(lambda: compress(body, encoding), min(args.repeat, 20))
+        except ImportError:
+            print(f"Skipping {encoding}: its package is not installed")
+            continue
+        results[f"compress_1mb_{encoding}"] = {**summarize(samples, sum(samples)),
+                                               "ratio": round(len(compress(body, encoding)) / len(body), 3)}
+    return results
+
+
+async def _bench_large_prompt(dispatch, executor: str, args) -> dict:
+    from prompts import PromptRenderer
+
+    renderer = PromptRenderer(executor, workers=2)
+    await renderer.start()
+    # Warm the pool up, so process start-up is not part of the measurement.
+    await renderer.render(dispatch)
+    lags = []
+    ticker = asyncio.create_task(_loop_lag(lags))
+    samples = []
+    remaining = min(args.repeat, 50)
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await renderer.render(dispatch)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(4)))
+    elapsed = time.perf_counter() - start
+    ticker.cancel()
+    await renderer.stop()
+    return {**summarize(samples, elapsed), "loop_max_lag_ms": round(max(lags, default=0) * 1000, 3)}
+
+
+@benchmark("webhook")
+def bench_webhook(args) -> dict:
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "fake_n8n.py"), "--port", str(port),
+                               "--delay", "0", "--no-callback"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return asyncio.run(_bench_webhook(f"http://127.0.0.1:{port}/webhook", args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def _bench_webhook(url: str, args) -> dict:
+    import httpx
+    from webhook_client import webhook_client
+
+    async with httpx.AsyncClient() as probe:
+        for _ in range(100):
+            try:
+                await probe.get(url.replace("/webhook", "/stats"))
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+
+    await webhook_client.open()
+    samples = []
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await webhook_client.post(url, json={"user_id": 1, "client_code": "bench",
+                                                 "answer_endpoint": "", "prompt": "x" * 2000})
+            samples.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await webhook_client.close()
+    return {f"webhook_post_concurrency_{args.concurrency}": summarize(samples, elapsed)}
+
+
+def _seed_conversation(messages: int) -> int:
+    from datetime import datetime, timedelta
+    from shared.database import SessionLocal
+    from shared.models import Client, Conversation, Message, User
+
+    with SessionLocal() as db:
+        client = Client(client_code=f"bench-{time.time_ns()}", name=f"Benchmark {time.time_ns()}")
+        db.add(client)
+        db.flush()
+        user = User(username="bench", client_id=client.id)
+        db.add(user)
+        db.flush()
+        conversation = Conversation(user_id=user.id, client_id=client.id, title="Benchmark")
+        db.add(conversation)
+        db.flush()
+        started = datetime.utcnow()
+        db.execute(Message.__table__.insert(), [
+            {"conversation_id": conversation.id, "role": "user" if i % 2 else "agent",
+             "content": f"Mensaje {i} " * 20, "timestamp": started + timedelta(milliseconds=i)}
+            for i in range(messages)
+        ])
+        db.commit()
+        return conversation.id
+
+
+@benchmark("history", database=True)
+def bench_history(args) -> dict:
+    conversation_id = _seed_conversation(10_000)
+    return asyncio.run(_bench_history(conversation_id, args))
+
+
+async def _bench_history(conversation_id: int, args) -> dict:
+    from history import HistoryEngine
+    from shared.database import AsyncSessionLocal
+    from writer import MessageWriter
+
+    cold, warm = [], []
+    writer = MessageWriter("direct")
+    async with AsyncSessionLocal() as db:
+        for _ in range(min(args.repeat, 50)):
+            # A fresh engine has no cached window, so this is the full backwards walk.
+            engine = HistoryEngine()
+            start = time.perf_counter()
+            await engine.history(db, 0, conversation_id)
+            cold.append(time.perf_counter() - start)
+
+        # The last engine keeps its window: each turn reads only the message just written.
+        for i in range(min(args.repeat, 200)):
+            await writer.write(db, conversation_id, "user", f"Nueva pregunta {i}")
+            start = time.perf_counter()
+            await engine.history(db, 0, conversation_id)
+            warm.append(time.perf_counter() - start)
+    return {
+        "history_10k_messages_cold": summarize(cold, sum(cold)),
+        "history_10k_messages_incremental": summarize(warm, sum(warm)),
+    }
+
+
+@benchmark("writer", database=True)
+def bench_writer(args) -> dict:
+    conversation_id = _seed_conversation(0)
+    return {f"message_writer_{mode}": asyncio.run(_bench_writer(mode, conversation_id, args))
+            for mode in ("direct", "batched")}
+
+
+async def _bench_writer(mode: str, conversation_id: int, args) -> dict:
+    from shared.database import AsyncSessionLocal, async_engine
+    from writer import MessageWriter
+
+    writer = MessageWriter(mode)
+    await writer.start()
+    samples = []
+    remaining = args.requests
+
+    async def sender():
+        nonlocal remaining
+        async with AsyncSessionLocal() as db:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                await writer.write(db, conversation_id, "user", "Mensaje de benchmark")
+                samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    await writer.stop()
+    # Each asyncio.run gets a new loop; pooled asyncpg connections can't cross it.
+    await async_engine.dispose()
+    return summarize(samples, elapsed)
+
+
+def _seed_lists(rows: int):
+    from datetime import datetime
+    from shared.database import SessionLocal
+    from shared.models import Client, User
+
+    prefix = f"list-{time.time_ns()}"
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        client_ids = db.execute(Client.__table__.insert().returning(Client.id), [
+            {"client_code": f"{prefix}-{i}", "name": f"Cliente {prefix} {i}", "status": "Activo", "created_at": now}
+            for i in range(rows)
+        ]).scalars().all()
+        db.execute(User.__table__.insert(), [
+            {"username": f"usuario-{i}", "client_id": client_id, "status": "Activo", "created_at": now}
+            for i, client_id in enumerate(client_ids)
+        ])
+        db.commit()
+
+
+@benchmark("lists", database=True)
+def bench_lists(args) -> dict:
+    from fastapi.testclient import TestClient
+
+    sys.path.insert(0, os.path.join(ROOT, "services", "core"))
+    from main import app
+
+    _seed_lists(100_000)
+    results = {}
+    with TestClient(app) as client:
+        for path in ("/clients", "/users"):
+            for format in ("json", "ndjson"):
+                def fetch():
+                    client.get(path, params={"format": format}).raise_for_status()
+                samples = timed(fetch, min(args.repeat, 10))
+                results[f"list_{path.strip('/')}_100k_{format}"] = summarize(samples, sum(samples))
+    return results
+
+
+BROADCAST_MESSAGE_BYTES = 50_000
+
+
+@benchmark("broadcast")
+def bench_broadcast(args) -> dict:
+    return asyncio.run(_bench_broadcast(args))
+
+
+async def _bench_broadcast(args) -> dict:
+    from broadcast import PostgresBroadcast, RedisBroadcast, notify_chunks
+
+    # Quotes, backslashes and non-ASCII text are what make chunking and re-encoding go wrong.
+    message = ('{"content": "Línea con \\ y \"comillas\" ñ"}\n' * BROADCAST_MESSAGE_BYTES)[:BROADCAST_MESSAGE_BYTES]
+    results = {}
+
+    class Listener:
+        def subscribe(self, channel, callback):
+            self.callback = callback
+
+    listener = Listener()
+    received = asyncio.Queue()
+
+    async def deliver(user_id: int, text: str):
+        await received.put((user_id, text))
+
+    postgres = PostgresBroadcast(listener)
+    await postgres.start(deliver)
+    samples = []
+    for _ in range(min(args.repeat, 100)):
+        start = time.perf_counter()
+        chunks = notify_chunks(7, message)
+        for chunk in chunks:
+            listener.callback(chunk)
+        got = await asyncio.wait_for(received.get(), 5)
+        samples.append(time.perf_counter() - start)
+        if got != (7, message):
+            FAILURES.append("broadcast: postgres chunked message came back altered")
+            break
+    results["broadcast_postgres_chunked_50kb"] = {**summarize(samples, sum(samples)), "chunks": len(chunks)}
+
+    try:
+        import fakeredis
+    except ImportError:
+        FAILURES.append("broadcast: fakeredis is not installed (pip install -r benchmarks/requirements.txt)")
+        return results
+    client = fakeredis.FakeAsyncRedis()
+    redis = RedisBroadcast(client=client)
+    await redis.start(deliver)
+    samples = []
+    try:
+        # The listener task subscribes in the background; wait until it has.
+        for _ in range(500):
+            if (await client.pubsub_numsub(redis.channel))[0][1]:
+                break
+            await asyncio.sleep(0.01)
+        for _ in range(min(args.repeat, 100)):
+            start = time.perf_counter()
+            await redis.publish(7, message)
+            try:
+                got = await asyncio.wait_for(received.get(), 5)
+            except asyncio.TimeoutError:
+                got = None
+            samples.append(time.perf_counter() - start)
+            if got != (7, message):
+                FAILURES.append("broadcast: redis message did not come back intact")
+                break
+    finally:
+        await redis.stop()
+    results["broadcast_redis_50kb"] = summarize(samples, sum(samples))
+    return results
+
+
+POOL_SIZE = 2
+POOL_MAX_OVERFLOW = 2
+POOL_TIMEOUT = 1.0
+POOL_EXTRA_CALLERS = 3
+
+
+@benchmark("pool", database=True)
+def bench_pool(args) -> dict:
+    return asyncio.run(_bench_pool())
+
+
+async def _bench_pool() -> dict:
+    from sqlalchemy import text
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from shared.database import ASYNC_DATABASE_URL, engine_options
+
+    options = {key: value for key, value in engine_options(async_driver=True).items() if key != "poolclass"}
+    engine = create_async_engine(ASYNC_DATABASE_URL, **{**options, "pool_size": POOL_SIZE,
+                                                       "max_overflow": POOL_MAX_OVERFLOW,
+                                                       "pool_timeout": POOL_TIMEOUT})
+    capacity = POOL_SIZE + POOL_MAX_OVERFLOW
+    callers = capacity + POOL_EXTRA_CALLERS
+
+    async def hold(seconds: float) -> Tuple[str, float]:
+        start = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+            return "ok", time.perf_counter() - start
+        except PoolTimeout:
+            return "timeout", time.perf_counter() - start
+
+    async def run(seconds: float, name: str, expect_timeouts: int) -> dict:
+        try:
+            # Generous outer deadline: reaching it means a caller hung instead of timing out.
+            outcomes = await asyncio.wait_for(asyncio.gather(*(hold(seconds) for _ in range(callers))),
+                                              seconds + POOL_TIMEOUT * 5)
+        except asyncio.TimeoutError:
+            FAILURES.append(f"pool: {name} callers hung past pool_timeout")
+            return {"hung": True}
+        waits = [elapsed for outcome, elapsed in outcomes if outcome == "timeout"]
+        result = {
+            "hung": False,
+            "admitted": sum(outcome == "ok" for outcome, _ in outcomes),
+            "timed_out": len(waits),
+            "max_timeout_wait_ms": round(max(waits, default=0) * 1000, 3),
+        }
+        if result["timed_out"] != expect_timeouts:
+            FAILURES.append(f"pool: {name} expected {expect_timeouts} pool timeouts, got {result['timed_out']}")
+        if any(wait > POOL_TIMEOUT + 1 for wait in waits):
+            FAILURES.append(f"pool: {name} callers waited {result['max_timeout_wait_ms']} ms "
+                            f"with pool_timeout={POOL_TIMEOUT}s")
+        return result
+
+    try:
+        results = {
+            # Every connection is held past pool_timeout, so exactly the callers beyond capacity give up.
+            "pool_saturated": await run(POOL_TIMEOUT * 3, "saturated", POOL_EXTRA_CALLERS),
+            # Connections come back well within pool_timeout, so the queued callers are all served.
+            "pool_queued": await run(POOL_TIMEOUT / 4, "queued", 0),
+        }
+    finally:
+        await engine.dispose()
+    return results
+
+
+PLAN_CLIENTS = 10_000
+PLAN_DAYS = 10
+PLAN_MESSAGES_PER_CONVERSATION = 10
+PLAN_TEMPLATES = 5
+# Tables every hot-path query must reach through an index; templates is a handful of rows.
+PLAN_TABLES = ("messages", "conversations", "users", "clients", "attributes")
+
+
+def _seed_plans() -> str:
+    """10k clients and users, 100k conversations and 1M messages, all created in SQL; returns the prefix."""
+    from sqlalchemy import text
+    from shared.database import SessionLocal
+
+    prefix = f"plan-{time.time_ns()}"
+    params = {"prefix": prefix, "clients": PLAN_CLIENTS, "days": PLAN_DAYS,
+              "messages": PLAN_MESSAGES_PER_CONVERSATION, "templates": PLAN_TEMPLATES}
+    statements = [
+        "INSERT INTO clients (client_code, name, status, created_at) "
+        "SELECT :prefix || '-' || g, 'Cliente ' || :prefix || ' ' || g, 'Activo', now() "
+        "FROM generate_series(1, :clients) g",
+        "INSERT INTO templates (key, description, data_type, status) "
+        "SELECT :prefix || '-' || g, 'Plantilla ' || g, 'text', 'Activo' FROM generate_series(1, :templates) g",
+        "INSERT INTO attributes (client_id, template_id, value, updated_at) "
+        "SELECT c.id, t.id, 'Valor ' || t.id, now() FROM clients c CROSS JOIN templates t "
+        "WHERE c.client_code LIKE :prefix || '-%' AND t.key LIKE :prefix || '-%'",
+        "INSERT INTO users (username, client_id, status, created_at) "
+        "SELECT 'usuario', id, 'Activo', now() FROM clients WHERE client_code LIKE :prefix || '-%'",
+        "INSERT INTO conversations (user_id, client_id, title, conversation_date, created_at, updated_at) "
+        "SELECT u.id, u.client_id, :prefix, (now() - d * interval '1 day')::date, "
+        "now() - d * interval '1 day', now() - d * interval '1 day' "
+        "FROM users u JOIN clients c ON c.id = u.client_id CROSS JOIN generate_series(0, :days - 1) d "
+        "WHERE c.client_code LIKE :prefix || '-%'",
+        "INSERT INTO messages (conversation_id, role, content, timestamp) "
+        "SELECT c.id, CASE WHEN m % 2 = 1 THEN 'user' ELSE 'agent' END, 'Mensaje de prueba ' || m, "
+        "c.created_at + m * interval '1 second' "
+        "FROM conversations c CROSS JOIN generate_series(1, :messages) m WHERE c.title = :prefix",
+    ]
+    with SessionLocal() as db:
+        for statement in statements:
+            db.execute(text(statement), params)
+        db.commit()
+        # Fresh statistics, so the planner sees the real table sizes.
+        db.execute(text("ANALYZE"))
+        db.commit()
+    return prefix
+
+
+def _scans(plan: dict) -> Iterator[Tuple[str, str]]:
+    """(node type, relation) for every node of an EXPLAIN (FORMAT JSON) plan that reads a table."""
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from _scans(child)
+
+
+def _hot_path_queries(db, prefix: str) -> Dict[str, object]:
+    """The statements the services run per request, built the same way they build them."""
+    from sqlalchemy import select
+    from shared.models import Attribute, Client, Conversation, Message, Template, User
+    from shared.partitions import messages_since
+
+    client = db.execute(select(Client.id).where(Client.client_code == f"{prefix}-{PLAN_CLIENTS // 2}")).scalar_one()
+    user = db.execute(select(User.id).where(User.client_id == client)).scalar_one()
+    conversation = db.execute(select(Conversation.id, Conversation.created_at).where(
+        Conversation.user_id == user).order_by(Conversation.created_at.desc()).limit(1)).one()
+    newest = db.execute(select(Message.id).where(Message.conversation_id == conversation.id)
+                        .order_by(Message.id.desc()).limit(1)).scalar_one()
+    since = messages_since(conversation.created_at)
+    history_columns = (Message.id, Message.role, Message.content)
+
+    return {
+        # services/agent/history.py
+        "history_tail": select(*history_columns).where(
+            Message.conversation_id == conversation.id, since).order_by(Message.id.desc()).limit(200),
+        "history_incremental": select(*history_columns).where(
+            Message.conversation_id == conversation.id, since, Message.id > newest - 2
+        ).order_by(Message.id).limit(200),
+        "history_previous_conversation": select(Conversation.id, Conversation.created_at).where(
+            Conversation.user_id == user, Conversation.id != conversation.id
+        ).order_by(Conversation.created_at.desc()).limit(1),
+        # shared/context_cache.py
+        "client_context": select(Template.description, Attribute.value).join(
+            Template, Attribute.template_id == Template.id
+        ).where(Attribute.client_id == client).order_by(Attribute.id),
+        # services/core/routers/users.py
+        "load_conversation_latest": select(Conversation).where(
+            Conversation.user_id == user).order_by(Conversation.created_at.desc()).limit(1),
+        "load_conversation_messages": select(Message).where(
+            Message.conversation_id == conversation.id, since).order_by(Message.timestamp),
+        "resume_messages": select(Message).where(
+            Message.conversation_id.in_(select(Conversation.id).where(Conversation.user_id == user)),
+            Message.id > newest - 5
+        ).order_by(Message.id).limit(500),
+        # The keyset pages of the core list routes (shared/pagination.py).
+        "list_clients": select(Client).where(Client.id > client).order_by(Client.id).limit(100),
+        "list_users_for_client": select(User).where(User.client_id == client, User.id > 0)
+        .order_by(User.id).limit(100),
+        "list_user_conversations": select(Conversation).where(Conversation.user_id == user, Conversation.id > 0)
+        .order_by(Conversation.id).limit(100),
+    }
+
+
+@benchmark("plans", database=True)
+def bench_plans(args) -> dict:
+    from shared.database import SessionLocal
+
+    prefix = _seed_plans()
+    results = {}
+    with SessionLocal() as db:
+        connection = db.connection()
+        for name, statement in _hot_path_queries(db, prefix).items():
+            compiled = statement.compile(dialect=connection.dialect)
+            (plan,) = connection.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}", compiled.params
+            ).scalar()
+            scans = list(_scans(plan["Plan"]))
+            sequential = [relation for node, relation in scans
+                          if node == "Seq Scan" and relation.startswith(PLAN_TABLES)]
+            if sequential:
+                FAILURES.append(f"plans: {name} scans {', '.join(sequential)} sequentially")
+            results[f"plan_{name}"] = {
+                "index_scan": not sequential,
+                "scans": [f"{node} on {relation}" for node, relation in scans],
+                "execution_ms": round(plan["Execution Time"], 3),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK", help=", ".join(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=1000, help="Iterations of in-process benchmarks.")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests/rows for throughput benchmarks.")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    selected = args.benchmarks or list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    with ExitStack() as stack:
+        if NEEDS_DATABASE.intersection(selected):
+            use_database(stack.enter_context(throwaway_postgres()))
+        for name in selected:
+            print(f"Running {name}...")
+            results.update(BENCHMARKS[name](args))
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("micro", {**config, "benchmarks": selected}, results, args.output)
+    if FAILURES:
+        raise SystemExit("Failed checks:\n  " + "\n  ".join(FAILURES))
+
+
+if __name__ == "__main__":
+    main()
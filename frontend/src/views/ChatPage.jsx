@@ -25,6 +25,7 @@ import MainCard from 'ui-component/cards/MainCard';
 
 const API_URL = import.meta.env.VITE_APP_API_URL || 'http://localhost:8000';
 const AGENT_PORT = import.meta.env.VITE_AGENT_PORT || '8001';
+const RESUME_PAGE_SIZE = 500;
 
 const ChatPage = () => {
   const theme = useTheme();
@@ -44,6 +45,48 @@ const ChatPage = () => {
   const [loading, setLoading] = useState(true);
 
   const messagesEndRef = useRef(null);
+  const lastSeqRef = useRef(0);
+
+  // Streamed answers arrive as deltas into a draft, which the stored message with the same stream_id replaces.
+  const receiveStreamEvent = (event) => {
+    const draftId = `stream-${event.stream_id}`;
+    if (event.type === 'answer_aborted') {
+      setMessages((prevMessages) => prevMessages.filter((m) => m.id !== draftId));
+      return;
+    }
+    setIsTyping(false);
+    setMessages((prevMessages) => {
+      const draftIndex = prevMessages.findIndex((m) => m.id === draftId);
+      if (draftIndex === -1) {
+        return [...prevMessages, { id: draftId, role: 'agent', content: event.delta, pending: true }];
+      }
+      const nextMessages = [...prevMessages];
+      nextMessages[draftIndex] = { ...nextMessages[draftIndex], content: nextMessages[draftIndex].content + event.delta };
+      return nextMessages;
+    });
+  };
+
+  // Pushes carry the full message plus its `seq`; the local echo of a sent message is replaced by the stored one.
+  const receiveMessage = (message) => {
+    if (message.type) {
+      receiveStreamEvent(message);
+      return;
+    }
+    lastSeqRef.current = Math.max(lastSeqRef.current, message.seq);
+    if (message.role !== 'user') setIsTyping(false);
+    setMessages((prevMessages) => {
+      if (prevMessages.some((m) => m.id === message.id)) return prevMessages;
+      const pendingIndex = message.stream_id
+        ? prevMessages.findIndex((m) => m.id === `stream-${message.stream_id}`)
+        : message.role === 'user'
+          ? prevMessages.findIndex((m) => m.pending && m.content === message.content)
+          : -1;
+      if (pendingIndex === -1) return [...prevMessages, message];
+      const nextMessages = [...prevMessages];
+      nextMessages[pendingIndex] = message;
+      return nextMessages;
+    });
+  };
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -86,23 +129,60 @@ const ChatPage = () => {
 
   useEffect(() => {
     if (!user) return;
-    const wsUrl = `ws://localhost:${AGENT_PORT}/ws/${user.user_id}`;
-    const ws = new WebSocket(wsUrl);
-    ws.onopen = () => console.log('WebSocket connection established');
-    ws.onmessage = (event) => {
-      setIsTyping(false);
+    let ws;
+    let reconnectTimer;
+    let closedByUs = false;
+
+    // The resume endpoint re-sends a short overlap before `after` (ids can commit out of order);
+    // receiveMessage skips the ids already shown. Pages are fetched until one comes back short.
+    const catchUp = async () => {
+      if (!lastSeqRef.current) return;
       try {
-        const newMessage = JSON.parse(event.data);
-        setMessages((prevMessages) => [...prevMessages, newMessage]);
-      } catch (e) {
-        if (event.data === 'new_message') {
-          console.log('User message processed by agent.');
+        let after = lastSeqRef.current;
+        for (;;) {
+          const response = await axios.get(`${API_URL}/users/${user.user_id}/messages`, {
+            params: { after, limit: RESUME_PAGE_SIZE }
+          });
+          response.data.forEach(receiveMessage);
+          const newer = response.data.filter((m) => m.id > after);
+          if (newer.length < RESUME_PAGE_SIZE) break;
+          after = newer.reduce((max, m) => Math.max(max, m.id), after);
         }
+      } catch (error) {
+        console.error('Error resuming conversation:', error);
       }
     };
-    ws.onclose = () => console.log('WebSocket connection closed');
-    ws.onerror = (error) => console.error('WebSocket error:', error);
-    return () => ws.close();
+
+    const connect = () => {
+      ws = new WebSocket(`ws://localhost:${AGENT_PORT}/ws/${user.user_id}`);
+      ws.onopen = () => {
+        console.log('WebSocket connection established');
+        catchUp();
+      };
+      ws.onmessage = (event) => {
+        if (event.data === 'ping') {
+          ws.send('pong');
+          return;
+        }
+        try {
+          receiveMessage(JSON.parse(event.data));
+        } catch (e) {
+          console.error('Unexpected WebSocket message:', event.data);
+        }
+      };
+      ws.onclose = () => {
+        console.log('WebSocket connection closed');
+        if (!closedByUs) reconnectTimer = setTimeout(connect, 2000);
+      };
+      ws.onerror = (error) => console.error('WebSocket error:', error);
+    };
+
+    connect();
+    return () => {
+      closedByUs = true;
+      clearTimeout(reconnectTimer);
+      ws.close();
+    };
   }, [user]);
 
   const initializeUser = async () => {
@@ -117,6 +197,7 @@ const ChatPage = () => {
       setUser(response.data);
       setCurrentConversation(response.data.conversation_id);
       setMessages(response.data.messages);
+      lastSeqRef.current = response.data.messages.reduce((max, m) => Math.max(max, m.seq), 0);
     } catch (error) {
       enqueueSnackbar(error.response?.data?.detail || 'Error al cargar la conversación', { variant: 'error' });
     }
@@ -124,7 +205,7 @@ const ChatPage = () => {
 
   const sendMessage = async () => {
     if (!messageText.trim() || !user?.username) return;
-    const tempMessage = { id: Date.now(), role: 'user', content: messageText };
+    const tempMessage = { id: `pending-${Date.now()}`, role: 'user', content: messageText, pending: true };
     setMessages((prevMessages) => [...prevMessages, tempMessage]);
     const currentMessage = messageText;
     setMessageText('');
@@ -150,6 +231,7 @@ const ChatPage = () => {
     setUser(null);
     setCurrentConversation(null);
     setMessages([]);
+    lastSeqRef.current = 0;
     setSelectedClient(null);
     setSelectedUsername('');
     setIsNewUser(false);
@@ -0,0 +1,34 @@
+"""Composite indexes for the message/conversation hot paths
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_conversations_user_id_created_at", "conversations", ["user_id", "created_at"])
+    op.create_index("ix_messages_conversation_id_timestamp", "messages", ["conversation_id", "timestamp"])
+    op.create_index("ix_messages_conversation_id_id", "messages", ["conversation_id", "id"])
+    op.create_index("ix_users_client_id", "users", ["client_id"])
+
+    # Older code could insert the same template twice for a client; keep the newest before enforcing uniqueness.
+    op.execute(
+        "DELETE FROM attributes a USING attributes b "
+        "WHERE a.client_id = b.client_id AND a.template_id = b.template_id AND a.id < b.id"
+    )
+    op.create_unique_constraint("uq_attributes_client_id_template_id", "attributes", ["client_id", "template_id"])
+
+
+def downgrade():
+    op.drop_constraint("uq_attributes_client_id_template_id", "attributes", type_="unique")
+    op.drop_index("ix_users_client_id", table_name="users")
+    op.drop_index("ix_messages_conversation_id_id", table_name="messages")
+    op.drop_index("ix_messages_conversation_id_timestamp", table_name="messages")
+    op.drop_index("ix_conversations_user_id_created_at", table_name="conversations")
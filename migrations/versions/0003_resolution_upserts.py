@@ -0,0 +1,39 @@
+"""Unique keys for the user/conversation upserts on /question
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Usernames are unique per client, not globally.
+    op.drop_index("ix_users_username", table_name="users")
+    op.create_index("ix_users_username", "users", ["username"])
+    op.create_unique_constraint("uq_users_client_id_username", "users", ["client_id", "username"])
+
+    op.add_column("conversations", sa.Column("conversation_date", sa.Date(), nullable=True))
+    # Racing first messages could leave several conversations for one day; only the oldest becomes
+    # that day's conversation, the rest keep their messages with a NULL date.
+    op.execute(
+        "UPDATE conversations c SET conversation_date = c.created_at::date "
+        "WHERE c.id = (SELECT min(o.id) FROM conversations o "
+        "WHERE o.user_id = c.user_id AND o.created_at::date = c.created_at::date)"
+    )
+    op.create_unique_constraint("uq_conversations_user_id_conversation_date", "conversations",
+                                ["user_id", "conversation_date"])
+
+
+def downgrade():
+    op.drop_constraint("uq_conversations_user_id_conversation_date", "conversations", type_="unique")
+    op.drop_column("conversations", "conversation_date")
+    op.drop_constraint("uq_users_client_id_username", "users", type_="unique")
+    op.drop_index("ix_users_username", table_name="users")
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
@@ -0,0 +1,84 @@
+"""Range-partition messages by month on timestamp
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# The current month and the next three get a partition; `python -m shared.partitions create`
+# keeps adding them from then on. Anything outside lands in messages_default instead of failing.
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce((SELECT min(timestamp) FROM messages_unpartitioned), now())),
+            date_trunc('month', now()) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade():
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey")
+    op.execute("UPDATE messages_unpartitioned SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL")
+
+    # The partition key has to be part of the primary key.
+    op.execute("""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            conversation_id integer NOT NULL REFERENCES conversations (id),
+            role varchar NOT NULL,
+            content text NOT NULL,
+            timestamp timestamp without time zone NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+
+    op.execute("INSERT INTO messages SELECT id, conversation_id, role, content, timestamp FROM messages_unpartitioned")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.drop_table("messages_unpartitioned")
+
+    op.create_index("ix_messages_id", "messages", ["id"])
+    op.create_index("ix_messages_conversation_id_timestamp", "messages", ["conversation_id", "timestamp"])
+    op.create_index("ix_messages_conversation_id_id", "messages", ["conversation_id", "id"])
+
+
+def downgrade():
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq') PRIMARY KEY,
+            conversation_id integer NOT NULL REFERENCES conversations (id),
+            role varchar NOT NULL,
+            content text NOT NULL,
+            timestamp timestamp without time zone
+        )
+    """)
+    op.execute("INSERT INTO messages SELECT id, conversation_id, role, content, timestamp FROM messages_partitioned")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    # Dropping the parent drops every partition with it.
+    op.drop_table("messages_partitioned")
+
+    op.create_index("ix_messages_id", "messages", ["id"])
+    op.create_index("ix_messages_conversation_id_timestamp", "messages", ["conversation_id", "timestamp"])
+    op.create_index("ix_messages_conversation_id_id", "messages", ["conversation_id", "id"])
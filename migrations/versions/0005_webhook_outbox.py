@@ -0,0 +1,35 @@
+"""Outbox table for durable n8n webhook delivery
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "webhook_outbox",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("client_id", sa.Integer(), sa.ForeignKey("clients.id"), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("message_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_webhook_outbox_pending_next_attempt_at", "webhook_outbox", ["next_attempt_at"],
+                    postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    op.drop_index("ix_webhook_outbox_pending_next_attempt_at", table_name="webhook_outbox")
+    op.drop_table("webhook_outbox")
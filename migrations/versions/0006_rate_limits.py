@@ -0,0 +1,26 @@
+"""Unlogged table for rate-limiter state shared by the agent workers
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rate_limits",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("tat", sa.DateTime(), nullable=False),
+        prefixes=["UNLOGGED"],
+    )
+
+
+def downgrade():
+    op.drop_table("rate_limits")
@@ -0,0 +1,163 @@
+from sqlalchemy import text
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import time
+import uuid
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.database import async_engine
+from shared.notify import PgListener, LISTENER_RETRY_SECONDS
+
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory")
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "ws_broadcast")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# NOTIFY payloads are capped at 8000 bytes; larger messages are split and reassembled.
+# json.dumps output is ASCII, so characters and bytes coincide.
+PG_CHUNK_SIZE = 7000
+PG_PARTIAL_TTL = 30.0
+
+Deliver = Callable[[int, str], Awaitable[None]]
+
+
+def notify_chunks(user_id: int, message: str) -> List[str]:
+    """The NOTIFY payloads for one message: itself if it fits, else parts that PostgresBroadcast reassembles."""
+    payload = json.dumps({"user_id": user_id, "message": message})
+    if len(payload) <= PG_CHUNK_SIZE:
+        return [payload]
+    message_id = uuid.uuid4().hex
+    # Re-encoding a part can at most double it (escaped quotes and backslashes).
+    step = PG_CHUNK_SIZE // 2 - 100
+    parts = [payload[i:i + step] for i in range(0, len(payload), step)]
+    return [
+        json.dumps({"chunk": message_id, "seq": seq, "total": len(parts), "data": part})
+        for seq, part in enumerate(parts)
+    ]
+
+
+class MemoryBroadcast:
+    """Single-process backend: publishing delivers straight to this worker's sockets."""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def publish(self, user_id: int, message: str):
+        if self._deliver:
+            await self._deliver(user_id, message)
+
+
+class PostgresBroadcast:
+    """Fans out through LISTEN/NOTIFY on the application database; needs no extra infrastructure."""
+
+    def __init__(self, listener: PgListener, channel: str = BROADCAST_CHANNEL):
+        self.channel = channel
+        self._deliver: Optional[Deliver] = None
+        self._partials: Dict[str, dict] = {}
+        listener.subscribe(channel, self._on_notification)
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def publish(self, user_id: int, message: str):
+        chunks = notify_chunks(user_id, message)
+        # One transaction, so every chunk is delivered together and in order.
+        async with async_engine.begin() as conn:
+            for chunk in chunks:
+                await conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {"channel": self.channel, "payload": chunk})
+
+    def _on_notification(self, payload: Optional[str]):
+        if payload is None or self._deliver is None:
+            return
+        data = json.loads(payload)
+        if "chunk" in data:
+            data = self._reassemble(data)
+            if data is None:
+                return
+        asyncio.create_task(self._deliver(data["user_id"], data["message"]))
+
+    def _reassemble(self, chunk: dict) -> Optional[dict]:
+        now = time.monotonic()
+        for key in [k for k, v in self._partials.items() if v["expires"] < now]:
+            del self._partials[key]
+        partial = self._partials.setdefault(chunk["chunk"], {"parts": {}, "expires": now + PG_PARTIAL_TTL})
+        partial["parts"][chunk["seq"]] = chunk["data"]
+        if len(partial["parts"]) < chunk["total"]:
+            return None
+        del self._partials[chunk["chunk"]]
+        return json.loads("".join(partial["parts"][i] for i in range(chunk["total"])))
+
+
+class RedisBroadcast:
+    """Fans out through Redis pub/sub (or any server speaking the same protocol).
+
+    `client` replaces the connection made from `url`, e.g. a fakeredis client in the benchmark checks.
+    """
+
+    def __init__(self, url: str = REDIS_URL, channel: str = BROADCAST_CHANNEL, client=None):
+        self.url = url
+        self.channel = channel
+        self._redis = client
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        if self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(self.url)
+        self._task = asyncio.create_task(self._listen(deliver))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def publish(self, user_id: int, message: str):
+        await self._redis.publish(self.channel, json.dumps({"user_id": user_id, "message": message}))
+
+    async def _listen(self, deliver: Deliver):
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for item in pubsub.listen():
+                    data = json.loads(item["data"])
+                    asyncio.create_task(deliver(data["user_id"], data["message"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Redis broadcast subscription lost, retrying: {e}")
+                await asyncio.sleep(LISTENER_RETRY_SECONDS)
+            finally:
+                # Each retry subscribes on a fresh connection; the old one goes back to the pool.
+                await pubsub.aclose()
+
+
+def create_broadcast(listener: PgListener):
+    if BROADCAST_BACKEND == "postgres":
+        return PostgresBroadcast(listener)
+    if BROADCAST_BACKEND == "redis":
+        return RedisBroadcast()
+    if BROADCAST_BACKEND == "memory":
+        return MemoryBroadcast()
+    raise ValueError(f"Unknown BROADCAST_BACKEND '{BROADCAST_BACKEND}'")
@@ -0,0 +1,127 @@
+from fastapi import WebSocket
+from typing import Dict, Optional, Set
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.metrics import WEBSOCKET_CONNECTIONS
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop")
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "60"))
+
+PING_MESSAGE = "ping"
+# "Try again later": the client fell too far behind and should reconnect and resume.
+CLOSE_OVERLOADED = 1013
+# "Going away": nothing heard from the client within WS_PING_TIMEOUT.
+CLOSE_HEARTBEAT_TIMEOUT = 1001
+
+
+class Connection:
+    """One socket with its own bounded outbound queue, drained by a dedicated writer task."""
+
+    def __init__(self, user_id: int, websocket: WebSocket):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.dropped = 0
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self, on_failure):
+        self._writer = asyncio.create_task(self._write_loop(on_failure))
+
+    def stop(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def enqueue(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def close(self, code: int):
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except RuntimeError:
+            pass
+
+    async def _write_loop(self, on_failure):
+        loop = asyncio.get_running_loop()
+        try:
+            next_ping = loop.time() + WS_PING_INTERVAL
+            while True:
+                if loop.time() >= next_ping:
+                    # Pings go out on a fixed schedule, however busy the outbound side is: the
+                    # client's pong is what keeps the receive loop's WS_PING_TIMEOUT from expiring.
+                    message = PING_MESSAGE
+                    next_ping = loop.time() + WS_PING_INTERVAL
+                else:
+                    try:
+                        message = await asyncio.wait_for(self.queue.get(), timeout=next_ping - loop.time())
+                    except asyncio.TimeoutError:
+                        continue
+                await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            on_failure(self)
+
+
+class ConnectionManager:
+    """Tracks this worker's sockets; messages reach them through the broadcast backend.
+
+    send_personal_message publishes, so a message produced on any worker is delivered by
+    whichever worker holds one of the user's sockets. A user may have several sockets open
+    (e.g. tabs); each gets its own copy. A socket whose queue overflows either loses the
+    message (WS_OVERFLOW_POLICY=drop) or is closed (disconnect).
+    """
+
+    def __init__(self, broadcast):
+        self.active_connections: Dict[int, Set[Connection]] = {}
+        self.broadcast = broadcast
+
+    async def start(self):
+        await self.broadcast.start(self.deliver_local)
+
+    async def stop(self):
+        await self.broadcast.stop()
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.stop()
+        self.active_connections.clear()
+        WEBSOCKET_CONNECTIONS.set(0)
+
+    async def connect(self, user_id: int, websocket: WebSocket) -> Connection:
+        await websocket.accept()
+        connection = Connection(user_id, websocket)
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        WEBSOCKET_CONNECTIONS.inc()
+        connection.start(self.disconnect)
+        return connection
+
+    def disconnect(self, connection: Connection):
+        connection.stop()
+        connections = self.active_connections.get(connection.user_id)
+        # Both the writer task and the receive loop may report the same socket gone.
+        if connections is not None and connection in connections:
+            connections.discard(connection)
+            WEBSOCKET_CONNECTIONS.dec()
+            if not connections:
+                del self.active_connections[connection.user_id]
+
+    async def send_personal_message(self, message: str, user_id: int):
+        await self.broadcast.publish(user_id, message)
+
+    async def deliver_local(self, user_id: int, message: str):
+        for connection in list(self.active_connections.get(user_id, ())):
+            if not connection.enqueue(message) and WS_OVERFLOW_POLICY == "disconnect":
+                self.disconnect(connection)
+                await connection.close(CLOSE_OVERLOADED)
@@ -0,0 +1,44 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.context_cache import client_context_cache
+from shared.resolution import Resolution
+from shared.settings_cache import settings_cache
+from history import history_engine
+from prompts import WebhookDispatch, prompt_renderer
+from webhook_client import webhook_client
+
+
+async def snapshot_dispatch(db: AsyncSession, resolved: Resolution, answer_path: str,
+                            message_id: int) -> Optional[WebhookDispatch]:
+    """The webhook payload for the question `message_id`, with the history up to that message."""
+    settings = await settings_cache.get_many(db, "URL_AGENT", "URL_ANSWER_HOST")
+    webhook_url = settings.get("URL_AGENT")
+    if not webhook_url:
+        return None
+
+    context = await client_context_cache.get(db, resolved.client_id, resolved.client_name)
+
+    history = await history_engine.history(db, resolved.user_id, resolved.conversation_id,
+                                           resolved.conversation_started_at, through_id=message_id)
+
+    agent_port = os.getenv("AGENT_PORT", "8001")
+
+    return WebhookDispatch(
+        user_id=resolved.user_id,
+        client_code=resolved.client_code,
+        webhook_url=webhook_url,
+        answer_endpoint=f"{settings.get('URL_ANSWER_HOST')}:{agent_port}{answer_path}",
+        context=context,
+        history=history,
+    )
+
+
+async def call_n8n_webhook(dispatch: WebhookDispatch):
+    """Post the prompt to n8n; errors propagate so the outbox can retry the delivery."""
+    rendered = await prompt_renderer.render(dispatch)
+    await webhook_client.post(dispatch.webhook_url, content=rendered.body, headers=rendered.headers)
@@ -0,0 +1,178 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.cache import TTLCache
+from shared.models import Conversation, Message
+from shared.partitions import messages_since
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "200"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "5000"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "3600"))
+# Ids are drawn at insert but become visible at commit, so a message can show up behind the
+# window's newest id; ids this much older than the newest message are checked for such gaps.
+HISTORY_COMMIT_LAG = float(os.getenv("HISTORY_COMMIT_LAG", "60"))
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token; good enough for budgeting without a tokenizer.
+    return len(text) // 4 + 1
+
+
+class HistoryWindow:
+    """The newest turns of one conversation that fit in the token budget."""
+
+    def __init__(self):
+        self.last_message_id = 0
+        self.last_timestamp: Optional[datetime] = None
+        # (message id, role, content, tokens), oldest first.
+        self.turns = deque()
+        self.tokens = 0
+        # True while the window still holds the conversation's very first message.
+        self.complete = True
+
+    def append(self, message_id: int, role: str, content: str, timestamp: datetime, budget: int):
+        if message_id <= self.last_message_id:
+            return
+        tokens = estimate_tokens(content)
+        self.turns.append((message_id, role, content, tokens))
+        self.tokens += tokens
+        self.last_message_id = message_id
+        self.last_timestamp = timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+        while self.tokens > budget and len(self.turns) > 1:
+            self.tokens -= self.turns.popleft()[3]
+            self.complete = False
+
+
+async def _fetch_tail(db: AsyncSession, conversation_id: int, started_at: Optional[datetime], budget: int,
+                      keep_newest: bool = True, through_id: Optional[int] = None) -> Tuple[List[tuple], bool]:
+    """Newest-first keyset walk back through a conversation until the budget is filled.
+
+    Returns the rows oldest-first and whether the walk reached the first message. With
+    `keep_newest` the newest message is returned even if it alone exceeds the budget; with
+    `through_id` the walk starts at that message instead of the newest one.
+    """
+    rows = []
+    tokens = 0
+    before_id = None if through_id is None else through_id + 1
+    while True:
+        query = select(Message.id, Message.role, Message.content, Message.timestamp).where(
+            Message.conversation_id == conversation_id,
+            messages_since(started_at)
+        )
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        page = (await db.execute(query.order_by(Message.id.desc()).limit(HISTORY_PAGE_SIZE))).all()
+        for row in page:
+            tokens += estimate_tokens(row.content)
+            if tokens > budget and (rows or not keep_newest):
+                rows.reverse()
+                return rows, False
+            rows.append(row)
+        if len(page) < HISTORY_PAGE_SIZE:
+            rows.reverse()
+            return rows, True
+        before_id = page[-1].id
+
+
+class HistoryEngine:
+    """Rolling, token-budgeted history windows per conversation.
+
+    A cached window only ever reads messages newer than the last one it has seen, so each
+    turn costs one indexed range scan on (conversation_id, id) regardless of history length,
+    plus one on (conversation_id, timestamp) over the last HISTORY_COMMIT_LAG seconds to spot
+    a message that committed behind a newer id.
+    """
+
+    def __init__(self, budget: int = HISTORY_TOKEN_BUDGET):
+        self.budget = budget
+        self._windows = TTLCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_TTL)
+
+    async def _build_window(self, db: AsyncSession, conversation_id: int,
+                            started_at: Optional[datetime]) -> HistoryWindow:
+        window = HistoryWindow()
+        rows, complete = await _fetch_tail(db, conversation_id, started_at, self.budget)
+        for row in rows:
+            window.append(row.id, row.role, row.content, row.timestamp, self.budget)
+        window.complete = window.complete and complete
+        self._windows.set(conversation_id, window)
+        return window
+
+    async def _missed_commits(self, db: AsyncSession, conversation_id: int, window: HistoryWindow) -> bool:
+        """Whether a message inside the window's id range committed after the window moved past it."""
+        if not window.turns:
+            return False
+        recent = (await db.execute(
+            select(Message.id).where(
+                Message.conversation_id == conversation_id,
+                Message.timestamp >= window.last_timestamp - timedelta(seconds=HISTORY_COMMIT_LAG),
+                Message.id > window.turns[0][0],
+                Message.id < window.last_message_id
+            )
+        )).scalars()
+        seen = {turn[0] for turn in window.turns}
+        return any(message_id not in seen for message_id in recent)
+
+    async def _load_window(self, db: AsyncSession, conversation_id: int,
+                           started_at: Optional[datetime]) -> HistoryWindow:
+        window = self._windows.get(conversation_id)
+        if window is None:
+            return await self._build_window(db, conversation_id, started_at)
+
+        while True:
+            page = (await db.execute(
+                select(Message.id, Message.role, Message.content, Message.timestamp).where(
+                    Message.conversation_id == conversation_id,
+                    messages_since(started_at),
+                    Message.id > window.last_message_id
+                ).order_by(Message.id).limit(HISTORY_PAGE_SIZE)
+            )).all()
+            for row in page:
+                window.append(row.id, row.role, row.content, row.timestamp, self.budget)
+            if len(page) < HISTORY_PAGE_SIZE:
+                break
+
+        if await self._missed_commits(db, conversation_id, window):
+            # Rare: rebuilding from the table puts the late message in its place.
+            return await self._build_window(db, conversation_id, started_at)
+        return window
+
+    async def history(self, db: AsyncSession, user_id: int, conversation_id: int,
+                      started_at: Optional[datetime] = None,
+                      through_id: Optional[int] = None) -> Tuple[Tuple[str, str], ...]:
+        """The prompt history, ending at message `through_id` when given (else at the newest message)."""
+        window = await self._load_window(db, conversation_id, started_at)
+        if through_id is None or window.last_message_id == through_id:
+            turns = [(role, content) for _, role, content, _ in window.turns]
+            complete, tokens = window.complete, window.tokens
+        else:
+            # Newer messages arrived after this question (or it is a retry): leave them out.
+            rows, complete = await _fetch_tail(db, conversation_id, started_at, self.budget,
+                                               through_id=through_id)
+            turns = [(row.role, row.content) for row in rows]
+            tokens = sum(estimate_tokens(row.content) for row in rows)
+
+        # On the first message of a conversation, carry over the tail of the previous one.
+        if complete and len(turns) == 1:
+            previous = (await db.execute(
+                select(Conversation.id, Conversation.created_at).where(
+                    Conversation.user_id == user_id,
+                    Conversation.id != conversation_id
+                ).order_by(Conversation.created_at.desc()).limit(1)
+            )).first()
+            remaining = self.budget - tokens
+            if previous and remaining > 0:
+                rows, _ = await _fetch_tail(db, previous.id, previous.created_at, remaining, keep_newest=False)
+                turns = [(row.role, row.content) for row in rows] + turns
+
+        return tuple(turns)
+
+
+history_engine = HistoryEngine()
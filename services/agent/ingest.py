@@ -0,0 +1,80 @@
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Annotated, Any, List, Tuple, Union
+import os
+
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "500"))
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class QuestionIn(BaseModel):
+    username: str = Field(min_length=1)
+    client_code: str = Field(min_length=1)
+    texto: str = Field(min_length=1)
+
+
+class AnswerIn(BaseModel):
+    user_id: int
+    client_code: str = Field(min_length=1)
+    texto: str = Field(min_length=1)
+
+
+def _single_or_batch(model) -> TypeAdapter:
+    # Built once at import: validate_json then parses and validates in one pass inside pydantic-core.
+    return TypeAdapter(Union[model, Annotated[List[model], Field(min_length=1, max_length=INGEST_MAX_BATCH)]])
+
+
+QUESTIONS = _single_or_batch(QuestionIn)
+ANSWERS = _single_or_batch(AnswerIn)
+
+
+def _media_type(value: str) -> str:
+    return value.split(";", 1)[0].strip().lower()
+
+
+def is_structured(request: Request) -> bool:
+    """True for JSON and msgpack bodies, as opposed to a plain text answer stream."""
+    media_type = _media_type(request.headers.get("content-type", ""))
+    return media_type == JSON_TYPE or media_type in MSGPACK_TYPES
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise HTTPException(status_code=415, detail="msgpack bodies need the msgpack package on the agent")
+    return msgpack
+
+
+async def read_items(request: Request, adapter: TypeAdapter) -> Tuple[list, bool]:
+    """Validated items of a JSON or msgpack body holding one object or a list of them, and whether it was a list."""
+    body = await request.body()
+    try:
+        if _media_type(request.headers.get("content-type", "")) in MSGPACK_TYPES:
+            msgpack = _msgpack()
+            try:
+                unpacked = msgpack.unpackb(body, raw=False)
+            except (ValueError, msgpack.UnpackException):
+                raise HTTPException(status_code=400, detail="Invalid msgpack body")
+            data = adapter.validate_python(unpacked)
+        else:
+            data = adapter.validate_json(body)
+    except ValidationError as e:
+        # "input" is dropped: for a JSON syntax error it is the raw body bytes, which can't be encoded
+        # into the response (pydantic 2.5 has no include_input flag).
+        errors = e.errors(include_url=False, include_context=False)
+        raise HTTPException(status_code=422, detail=[{k: v for k, v in error.items() if k != "input"}
+                                                     for error in errors])
+    if isinstance(data, list):
+        return data, True
+    return [data], False
+
+
+def respond(request: Request, content: Any) -> Response:
+    """orjson-encoded response, or msgpack when the caller accepts it."""
+    if any(media_type in request.headers.get("accept", "") for media_type in MSGPACK_TYPES):
+        return Response(_msgpack().packb(content), media_type=MSGPACK_TYPES[0])
+    return ORJSONResponse(content)
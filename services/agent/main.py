@@ -1,28 +1,69 @@
-from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, Depends, Request, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from contextlib import asynccontextmanager
 from datetime import date
+from typing import Optional
 import asyncio
+import codecs
 import sys
 import os
-import httpx
 import json
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
+os.environ.setdefault("DB_SERVICE", "agent")
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from shared.database import get_db, engine
-from shared.models import Base, User, Client, Conversation, Message, Setting, Attribute
+from shared.database import get_async_db
+from shared.context_cache import client_context_cache, CLIENT_CONTEXT_CHANNEL
+from shared.identity_cache import identity_cache, IDENTITY_CHANNEL
+from shared.metrics import MetricsMiddleware, metrics_response
+from shared.notify import PgListener
+from shared.settings_cache import settings_cache, SETTINGS_CHANNEL
+from shared.models import Message
+from broadcast import create_broadcast
+from connections import ConnectionManager, WS_PING_TIMEOUT, CLOSE_HEARTBEAT_TIMEOUT
+from ingest import ANSWERS, QUESTIONS, is_structured, read_items, respond
+from outbox import OutboxDispatcher, outbox_entry
+from prompts import prompt_renderer
+from ratelimit import admission, retry_after
+from webhook_client import webhook_client
+from writer import message_writer
 
 QUESTION_ENDPOINT = os.getenv("QUESTION_ENDPOINT", "/question")
 ANSWER_ENDPOINT = os.getenv("ANSWER_ENDPOINT", "/answer")
 
-Base.metadata.create_all(bind=engine)
+pg_listener = PgListener()
+pg_listener.subscribe(SETTINGS_CHANNEL, settings_cache.invalidate)
+pg_listener.subscribe(CLIENT_CONTEXT_CHANNEL, client_context_cache.invalidate)
+pg_listener.subscribe(IDENTITY_CHANNEL, identity_cache.invalidate)
 
-app = FastAPI(title="Agent Service")
+manager = ConnectionManager(create_broadcast(pg_listener))
+outbox_dispatcher = OutboxDispatcher(ANSWER_ENDPOINT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await webhook_client.open()
+    await prompt_renderer.start()
+    await message_writer.start()
+    await outbox_dispatcher.start()
+    await manager.start()
+    pg_listener.start()
+    yield
+    await pg_listener.stop()
+    await manager.stop()
+    await outbox_dispatcher.stop()
+    await message_writer.stop()
+    await prompt_renderer.stop()
+    await webhook_client.close()
+
+
+app = FastAPI(title="Agent Service", lifespan=lifespan)
 
 FRONTEND_PORT = os.getenv("FRONTEND_PORT", "3000")
 origins = [
@@ -37,173 +78,209 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+
+def message_event(message: Message, stream_id: Optional[str] = None) -> str:
+    # The id doubles as the client's resume token. Ids can commit out of order, so resuming
+    # overlaps the last few seconds and the client ignores ids it already has.
+    event = {
+        "id": message.id,
+        "seq": message.id,
+        "conversation_id": message.conversation_id,
+        "role": message.role,
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat()
+    }
+    if stream_id is not None:
+        # Lets the client swap the draft it built from the deltas for the stored message.
+        event["stream_id"] = stream_id
+    return json.dumps(event)
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
-
-    async def connect(self, user_id: int, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-
-    async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
-
-
-manager = ConnectionManager()
-
-
-def build_prompt(db: Session, client: Client, user: User, today_conversation: Conversation) -> str:
-    attributes_query = db.query(Attribute).filter(Attribute.client_id == client.id).all()
-
-    context_parts = [f"Contexto de la empresa {client.name}:"]
-    for attr in attributes_query:
-        if attr.template:
-            context_parts.append(f"- {attr.template.description}: {attr.value}")
-
-    context_str = "\n".join(context_parts)
-
-    messages_to_format = []
-
-    message_count_today = db.query(Message).filter(Message.conversation_id == today_conversation.id).count()
-
-    if message_count_today == 1:
-        previous_conversation = db.query(Conversation).filter(
-            Conversation.user_id == user.id,
-            Conversation.id != today_conversation.id
-        ).order_by(Conversation.created_at.desc()).first()
-        if previous_conversation:
-            messages_to_format.extend(
-                db.query(Message).filter(Message.conversation_id == previous_conversation.id).order_by(
-                    Message.timestamp).all()
-            )
-
-    messages_to_format.extend(
-        db.query(Message).filter(Message.conversation_id == today_conversation.id).order_by(Message.timestamp).all()
-    )
+def stream_event(event_type: str, stream_id: str, **fields) -> str:
+    return json.dumps({"type": event_type, "stream_id": stream_id, **fields})
 
-    history_str = "\n".join([f"{msg.role}: {msg.content}" for msg in messages_to_format])
 
-    prompt_parts = [
-        context_str,
-        "\nResponde a la ultima pregunta del siguiente historial:",
-        history_str
-    ]
+@app.get(QUESTION_ENDPOINT)
+async def add_message(username: str, client_code: str, texto: str, db: AsyncSession = Depends(get_async_db)):
+    # Admission comes first: resolving upserts the user and conversation, which a rejected question must not.
+    wait = await admission.check(db, client_code, username)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many questions, retry later",
+                            headers={"Retry-After": retry_after(wait)})
 
-    return "\n".join(prompt_parts)
+    resolved = await identity_cache.question(db, client_code, username, date.today())
+    if resolved is None:
+        raise HTTPException(status_code=404, detail=f"Client with code '{client_code}' not found or inactive")
 
+    # The webhook delivery is queued in the same transaction as the message, so neither is lost.
+    db_message = await message_writer.write(db, resolved.conversation_id, "user", texto,
+                                            outbox=outbox_entry(resolved))
+    outbox_dispatcher.wake()
 
-async def call_n8n_webhook(db: Session, user: User, client: Client, conversation: Conversation):
-    webhook_setting = db.query(Setting).filter(Setting.key == "URL_AGENT").first()
-    answer_setting = db.query(Setting).filter(Setting.key == "URL_ANSWER_HOST").first()
-    if webhook_setting and webhook_setting.value:
-        webhook_url = webhook_setting.value
+    asyncio.create_task(manager.send_personal_message(message_event(db_message), resolved.user_id))
 
-        prompt = build_prompt(db, client, user, conversation)
+    return {"status": "message received"}
 
-        agent_port = os.getenv("AGENT_PORT", "8001")
 
-        payload = {
-            "user_id": user.id,
-            "client_code": client.client_code,
-            "answer_endpoint": f"{answer_setting.value}:{agent_port}{ANSWER_ENDPOINT}",
-            "prompt": prompt,
-        }
-        try:
-            async with httpx.AsyncClient() as http_client:
-                await http_client.post(webhook_url, json=payload)
-        except httpx.RequestError as e:
-            print(f"Error calling n8n webhook: {e}")
+@app.get(ANSWER_ENDPOINT)
+async def add_response(user_id: int, client_code: str, texto: str, db: AsyncSession = Depends(get_async_db)):
+    resolved = await identity_cache.answer(db, user_id, client_code, date.today())
+    if not resolved:
+        raise HTTPException(status_code=404, detail="User not found or does not belong to the specified client")
 
+    if resolved.conversation_id is None:
+        raise HTTPException(status_code=404, detail="No conversation found for this user")
 
-@app.get(QUESTION_ENDPOINT)
-async def add_message(username: str, client_code: str, texto: str, db: Session = Depends(get_db)):
-    user = db.query(User).join(Client).filter(
-        User.username == username,
-        Client.client_code == client_code
-    ).first()
-
-    if not user:
-        client = db.query(Client).filter(Client.client_code == client_code).first()
-        if not client:
-            raise HTTPException(status_code=404, detail=f"Client with code '{client_code}' not found")
-
-        user = User(username=username, client_id=client.id)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    else:
-        client = user.client
-
-    today_date = date.today()
-    conversation = db.query(Conversation).filter(
-        Conversation.user_id == user.id,
-        Conversation.created_at >= today_date
-    ).first()
-
-    if not conversation:
-        conversation = Conversation(user_id=user.id, client_id=user.client_id,
-                                    title=f"Conversación {user.username} - {today_date.strftime('%d/%m/%Y')}")
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-
-    db_message = Message(conversation_id=conversation.id, role="user", content=texto)
-    db.add(db_message)
-    db.commit()
-
-    asyncio.create_task(manager.send_personal_message("new_message", user.id))
-    asyncio.create_task(call_n8n_webhook(db, user, client, conversation))
+    db_message = await message_writer.write(db, resolved.conversation_id, "agent", texto)
 
-    return {"status": "message received"}
+    asyncio.create_task(manager.send_personal_message(message_event(db_message), user_id))
+    return {"status": "response sent"}
 
 
-@app.get(ANSWER_ENDPOINT)
-async def add_response(user_id: int, client_code: str, texto: str, db: Session = Depends(get_db)):
-    user = db.query(User).join(Client).filter(
-        User.id == user_id,
-        Client.client_code == client_code
-    ).first()
-    if not user:
+@app.post(QUESTION_ENDPOINT)
+async def post_questions(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """JSON or msgpack body with one question object or a list of up to INGEST_MAX_BATCH.
+
+    A list is written in one transaction and answered with a per-item result list; unknown
+    clients and rate-limited users fail only their own items.
+    """
+    questions, batch = await read_items(request, QUESTIONS)
+    today = date.today()
+    results = [None] * len(questions)
+    accepted = []
+    for i, question in enumerate(questions):
+        wait = await admission.check(db, question.client_code, question.username)
+        if wait:
+            results[i] = {"status": "rate_limited", "retry_after": retry_after(wait)}
+            continue
+        resolved = await identity_cache.question(db, question.client_code, question.username, today)
+        if resolved is None:
+            results[i] = {"status": "error",
+                          "detail": f"Client with code '{question.client_code}' not found or inactive"}
+        else:
+            accepted.append((i, resolved, question))
+    if not batch and not accepted:
+        if results[0]["status"] == "rate_limited":
+            raise HTTPException(status_code=429, detail="Too many questions, retry later",
+                                headers={"Retry-After": results[0]["retry_after"]})
+        raise HTTPException(status_code=404, detail=results[0]["detail"])
+
+    messages = await message_writer.write_many(db, [
+        (resolved.conversation_id, "user", question.texto, outbox_entry(resolved))
+        for _, resolved, question in accepted
+    ])
+    if accepted:
+        outbox_dispatcher.wake()
+    for (i, resolved, _), db_message in zip(accepted, messages):
+        asyncio.create_task(manager.send_personal_message(message_event(db_message), resolved.user_id))
+        results[i] = {"status": "message received", "id": db_message.id}
+
+    return respond(request, results if batch else results[0])
+
+
+@app.post(ANSWER_ENDPOINT)
+async def post_response(request: Request, user_id: Optional[int] = None, client_code: Optional[str] = None,
+                        db: AsyncSession = Depends(get_async_db)):
+    """A JSON/msgpack answer (or list of answers), or else a text answer streamed in the body."""
+    if is_structured(request):
+        return await post_answers(request, db)
+    if user_id is None or client_code is None:
+        raise HTTPException(status_code=422, detail="user_id and client_code are required to stream an answer")
+    return await stream_response(request, user_id, client_code, db)
+
+
+async def post_answers(request: Request, db: AsyncSession):
+    answers, batch = await read_items(request, ANSWERS)
+    today = date.today()
+    results = [None] * len(answers)
+    accepted = []
+    for i, answer in enumerate(answers):
+        resolved = await identity_cache.answer(db, answer.user_id, answer.client_code, today)
+        if not resolved:
+            results[i] = {"status": "error",
+                          "detail": "User not found or does not belong to the specified client"}
+        elif resolved.conversation_id is None:
+            results[i] = {"status": "error", "detail": "No conversation found for this user"}
+        else:
+            accepted.append((i, resolved, answer))
+    if not batch and not accepted:
+        raise HTTPException(status_code=404, detail=results[0]["detail"])
+
+    messages = await message_writer.write_many(db, [
+        (resolved.conversation_id, "agent", answer.texto, None) for _, resolved, answer in accepted
+    ])
+    for (i, resolved, _), db_message in zip(accepted, messages):
+        asyncio.create_task(manager.send_personal_message(message_event(db_message), resolved.user_id))
+        results[i] = {"status": "response sent", "id": db_message.id}
+
+    return respond(request, results if batch else results[0])
+
+
+async def stream_response(request: Request, user_id: int, client_code: str, db: AsyncSession):
+    """Streamed answer: the body is UTF-8 text, usually sent with chunked transfer encoding.
+
+    Every chunk is relayed to the user's sockets as an "answer_delta" event as soon as it arrives;
+    the Message is stored once the body ends and then pushed like any other, with the stream_id.
+    Deltas may be dropped for a slow socket, but the final message always carries the full text.
+    """
+    resolved = await identity_cache.answer(db, user_id, client_code, date.today())
+    if not resolved:
         raise HTTPException(status_code=404, detail="User not found or does not belong to the specified client")
 
-    conversation = db.query(Conversation).filter(
-        Conversation.user_id == user.id
-    ).order_by(Conversation.created_at.desc()).first()
-
-    if not conversation:
+    if resolved.conversation_id is None:
         raise HTTPException(status_code=404, detail="No conversation found for this user")
 
-    db_message = Message(conversation_id=conversation.id, role="agent", content=texto)
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-
-    message_data = {
-        "id": db_message.id,
-        "role": db_message.role,
-        "content": db_message.content,
-        "timestamp": db_message.timestamp.isoformat()
-    }
+    # Don't hold a pooled connection for as long as the model keeps generating.
+    await db.close()
 
-    asyncio.create_task(manager.send_personal_message(json.dumps(message_data), user_id))
+    stream_id = uuid.uuid4().hex
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts = []
+    try:
+        async for chunk in request.stream():
+            delta = decoder.decode(chunk)
+            if delta:
+                parts.append(delta)
+                await manager.send_personal_message(
+                    stream_event("answer_delta", stream_id, conversation_id=resolved.conversation_id, delta=delta),
+                    user_id
+                )
+    except ClientDisconnect:
+        await manager.send_personal_message(stream_event("answer_aborted", stream_id), user_id)
+        return {"status": "aborted"}
+    parts.append(decoder.decode(b"", final=True))
+
+    content = "".join(parts)
+    if not content.strip():
+        await manager.send_personal_message(stream_event("answer_aborted", stream_id), user_id)
+        raise HTTPException(status_code=400, detail="Empty answer")
+
+    db_message = await message_writer.write(db, resolved.conversation_id, "agent", content)
+
+    await manager.send_personal_message(message_event(db_message, stream_id), user_id)
     return {"status": "response sent"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(user_id, websocket)
+    connection = await manager.connect(user_id, websocket)
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(user_id)
+            # Any inbound frame (including the client's "pong") counts as a heartbeat.
+            await asyncio.wait_for(websocket.receive_text(), timeout=WS_PING_TIMEOUT)
+    except asyncio.TimeoutError:
+        await connection.close(CLOSE_HEARTBEAT_TIMEOUT)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(connection)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from typing import Dict, List, Optional, Set
+import asyncio
+import random
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.database import AsyncSessionLocal
+from shared.metrics import OUTBOX_DELIVERIES
+from shared.models import WebhookOutbox
+from shared.resolution import Resolution
+from shared.settings_cache import settings_cache
+from dispatch import snapshot_dispatch, call_n8n_webhook
+from ratelimit import TokenBucket
+from webhook_client import CircuitOpenError, WEBHOOK_BREAKER_RESET
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+# A claimed row becomes due again after this long, in case its worker died mid-delivery.
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "300"))
+OUTBOX_CLIENT_RATE = float(os.getenv("OUTBOX_CLIENT_RATE", "0"))
+OUTBOX_CLIENT_BURST = int(os.getenv("OUTBOX_CLIENT_BURST", "10"))
+OUTBOX_SHUTDOWN_GRACE = float(os.getenv("OUTBOX_SHUTDOWN_GRACE", "10"))
+
+
+def outbox_entry(resolved: Resolution) -> dict:
+    """WebhookOutbox values for a question from `resolved`; the writer adds the id of the Message it goes with."""
+    payload = asdict(resolved)
+    if resolved.conversation_started_at is not None:
+        payload["conversation_started_at"] = resolved.conversation_started_at.isoformat()
+    return {"client_id": resolved.client_id, "payload": payload}
+
+
+def _resolution(payload: dict) -> Resolution:
+    started_at = payload.get("conversation_started_at")
+    return Resolution(**{**payload,
+                         "conversation_started_at": datetime.fromisoformat(started_at) if started_at else None})
+
+
+class OutboxDispatcher:
+    """Delivers WebhookOutbox rows to the n8n webhook with at-least-once semantics.
+
+    One loop claims due rows with FOR UPDATE SKIP LOCKED (so several agent workers can share the
+    table) and hands each to a delivery task, never more than OUTBOX_WORKERS at once; whatever
+    doesn't fit stays in the table, so memory is bounded however far n8n falls behind. A
+    delivered row is deleted; a failed one is retried with exponential backoff and marked 'dead'
+    after OUTBOX_MAX_ATTEMPTS. With OUTBOX_CLIENT_RATE set, each client is limited to that many
+    deliveries per second (bursts of OUTBOX_CLIENT_BURST) and the excess is postponed. The
+    WEBHOOK_MAX_IN_FLIGHT setting, when present, lowers the number of concurrent deliveries at runtime.
+    """
+
+    def __init__(self, answer_path: str, workers: int = OUTBOX_WORKERS):
+        self.answer_path = answer_path
+        self.workers = workers
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    def wake(self):
+        """Look for due rows now instead of at the next poll, e.g. right after a question is committed."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._deliveries:
+            # Anything still running is cancelled and redelivered once its lease runs out.
+            _, running = await asyncio.wait(self._deliveries, timeout=OUTBOX_SHUTDOWN_GRACE)
+            for task in running:
+                task.cancel()
+
+    async def _capacity(self) -> int:
+        async with AsyncSessionLocal() as db:
+            value = await settings_cache.get(db, "WEBHOOK_MAX_IN_FLIGHT")
+        try:
+            return max(1, min(self.workers, int(value))) if value else self.workers
+        except ValueError:
+            return self.workers
+
+    async def _run(self):
+        while True:
+            try:
+                capacity = await self._capacity()
+            except Exception as e:
+                print(f"Error reading WEBHOOK_MAX_IN_FLIGHT: {e}")
+                capacity = self.workers
+            free = capacity - len(self._deliveries)
+            if free <= 0:
+                await asyncio.wait(self._deliveries, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            self._wake.clear()
+            try:
+                claimed = await self._claim(free)
+            except Exception as e:
+                print(f"Error claiming webhook outbox entries: {e}")
+                claimed = []
+            for entry in claimed:
+                task = asyncio.create_task(self._deliver(entry))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+
+            if len(claimed) < free:
+                # Nothing else is due: sleep until the next question or poll.
+                try:
+                    await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, limit: int) -> List:
+        now = datetime.utcnow()
+        due = select(WebhookOutbox.id).where(
+            WebhookOutbox.status == 'pending',
+            WebhookOutbox.next_attempt_at <= now
+        ).order_by(WebhookOutbox.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+        statement = update(WebhookOutbox).where(WebhookOutbox.id.in_(due.scalar_subquery())).values(
+            attempts=WebhookOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE)
+        ).returning(
+            WebhookOutbox.id, WebhookOutbox.client_id, WebhookOutbox.payload, WebhookOutbox.message_id,
+            WebhookOutbox.attempts
+        ).execution_options(synchronize_session=False)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(statement)).all()
+            await db.commit()
+        return rows
+
+    def _throttle(self, client_id: int) -> float:
+        if not OUTBOX_CLIENT_RATE:
+            return 0.0
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = TokenBucket(OUTBOX_CLIENT_RATE, OUTBOX_CLIENT_BURST)
+        return bucket.take()
+
+    async def _deliver(self, entry):
+        wait = self._throttle(entry.client_id)
+        if wait:
+            OUTBOX_DELIVERIES.labels(outcome="throttled").inc()
+            await self._postpone(entry.id, wait)
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                dispatch = await snapshot_dispatch(db, _resolution(entry.payload), self.answer_path,
+                                                   entry.message_id)
+            if dispatch is None:
+                # No URL_AGENT configured: there is nowhere to deliver to.
+                OUTBOX_DELIVERIES.labels(outcome="skipped").inc()
+            else:
+                await call_n8n_webhook(dispatch)
+                OUTBOX_DELIVERIES.labels(outcome="delivered").inc()
+        except CircuitOpenError:
+            # The webhook is known to be down; wait for the breaker without spending an attempt.
+            OUTBOX_DELIVERIES.labels(outcome="throttled").inc()
+            await self._postpone(entry.id, WEBHOOK_BREAKER_RESET)
+            return
+        except Exception as e:
+            await self._failed(entry, e)
+            return
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(WebhookOutbox).where(WebhookOutbox.id == entry.id))
+            await db.commit()
+
+    async def _postpone(self, entry_id: int, seconds: float):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(WebhookOutbox).where(WebhookOutbox.id == entry_id).values(
+                attempts=WebhookOutbox.attempts - 1,
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=seconds)
+            ))
+            await db.commit()
+
+    async def _failed(self, entry, error: Exception):
+        values = {"last_error": f"{type(error).__name__}: {error}"}
+        if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(f"Giving up on webhook outbox entry {entry.id} after {entry.attempts} attempts: {error}")
+            OUTBOX_DELIVERIES.labels(outcome="dead").inc()
+            values["status"] = 'dead'
+        else:
+            delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF * 2 ** (entry.attempts - 1))
+            # Jitter, so a backlog built up during an outage doesn't retry in lockstep.
+            values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+            OUTBOX_DELIVERIES.labels(outcome="retried").inc()
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(WebhookOutbox).where(WebhookOutbox.id == entry.id).values(**values))
+            await db.commit()
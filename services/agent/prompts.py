@@ -0,0 +1,137 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import asyncio
+import gzip
+import importlib
+import multiprocessing
+import time
+import sys
+import os
+import orjson
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.metrics import PROMPT_BUILD_DURATION, PROMPT_SIZE
+
+PROMPT_EXECUTOR = os.getenv("PROMPT_EXECUTOR", "inline")
+PROMPT_WORKERS = int(os.getenv("PROMPT_WORKERS", "2"))
+# Smaller prompts render faster inline than the hop to a pool costs.
+PROMPT_OFFLOAD_CHARS = int(os.getenv("PROMPT_OFFLOAD_CHARS", "65536"))
+PROMPT_MAX_PENDING = int(os.getenv("PROMPT_MAX_PENDING", "16"))
+PROMPT_COMPRESSION = os.getenv("PROMPT_COMPRESSION", "none")
+PROMPT_COMPRESS_MIN_BYTES = int(os.getenv("PROMPT_COMPRESS_MIN_BYTES", "16384"))
+PROMPT_COMPRESS_LEVEL = int(os.getenv("PROMPT_COMPRESS_LEVEL", "3"))
+
+
+@dataclass(frozen=True)
+class WebhookDispatch:
+    """Everything the n8n webhook needs, captured while the request session is still open."""
+    user_id: int
+    client_code: str
+    webhook_url: str
+    answer_endpoint: str
+    context: str
+    history: Tuple[Tuple[str, str], ...]
+
+
+@dataclass(frozen=True)
+class RenderedPayload:
+    body: bytes
+    headers: Dict[str, str]
+    prompt_chars: int
+    seconds: float
+
+
+def build_prompt(dispatch: WebhookDispatch) -> str:
+    history_str = "\n".join([f"{role}: {content}" for role, content in dispatch.history])
+
+    prompt_parts = [
+        dispatch.context,
+        "\nResponde a la ultima pregunta del siguiente historial:",
+        history_str
+    ]
+
+    return "\n".join(prompt_parts)
+
+
+def compress(body: bytes, encoding: str, level: int = PROMPT_COMPRESS_LEVEL) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level)
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unknown PROMPT_COMPRESSION '{encoding}'")
+
+
+def render_payload(dispatch: WebhookDispatch, compression: str = PROMPT_COMPRESSION) -> RenderedPayload:
+    """The webhook request body for `dispatch`; a plain function so it can run in a worker process."""
+    start = time.perf_counter()
+    prompt = build_prompt(dispatch)
+    body = orjson.dumps({
+        "user_id": dispatch.user_id,
+        "client_code": dispatch.client_code,
+        "answer_endpoint": dispatch.answer_endpoint,
+        "prompt": prompt,
+    })
+    headers = {"content-type": "application/json"}
+    if compression != "none" and len(body) >= PROMPT_COMPRESS_MIN_BYTES:
+        body = compress(body, compression)
+        headers["content-encoding"] = compression
+    return RenderedPayload(body, headers, len(prompt), time.perf_counter() - start)
+
+
+def estimated_chars(dispatch: WebhookDispatch) -> int:
+    return len(dispatch.context) + sum(len(role) + len(content) + 2 for role, content in dispatch.history)
+
+
+class PromptRenderer:
+    """Renders webhook payloads inline, or in a thread or process pool (PROMPT_EXECUTOR).
+
+    With a pool, prompts of PROMPT_OFFLOAD_CHARS or more are rendered off the event loop, so a
+    huge context doesn't stall every other request on the worker. At most PROMPT_MAX_PENDING
+    renders wait for the pool; further callers wait on the loop without queueing more work.
+    """
+
+    def __init__(self, executor: str = PROMPT_EXECUTOR, workers: int = PROMPT_WORKERS,
+                 compression: str = PROMPT_COMPRESSION):
+        if executor not in ("inline", "thread", "process"):
+            raise ValueError(f"Unknown PROMPT_EXECUTOR '{executor}'")
+        # Checked here so a bad setting stops the service at boot, not every outbox delivery.
+        if compression not in ("none", "gzip", "zstd"):
+            raise ValueError(f"Unknown PROMPT_COMPRESSION '{compression}'")
+        if compression == "zstd":
+            importlib.import_module("zstandard")
+        self.executor = executor
+        self.compression = compression
+        self.workers = workers
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        if self.executor == "thread":
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="prompt")
+        elif self.executor == "process":
+            # Forking a process that is running an event loop and DB pools is unsafe; spawn starts clean.
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._slots = asyncio.Semaphore(PROMPT_MAX_PENDING)
+
+    async def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def render(self, dispatch: WebhookDispatch) -> RenderedPayload:
+        if self._pool is None or estimated_chars(dispatch) < PROMPT_OFFLOAD_CHARS:
+            rendered = render_payload(dispatch, self.compression)
+        else:
+            async with self._slots:
+                rendered = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, render_payload, dispatch, self.compression
+                )
+        PROMPT_BUILD_DURATION.observe(rendered.seconds)
+        PROMPT_SIZE.observe(rendered.prompt_chars)
+        return rendered
+
+
+prompt_renderer = PromptRenderer()
@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import math
+import time
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.cache import TTLCache
+from shared.database import async_engine
+from shared.metrics import RATE_LIMITED
+from shared.settings_cache import settings_cache
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_CACHE_SIZE = int(os.getenv("RATE_LIMIT_CACHE_SIZE", "100000"))
+RATE_LIMIT_PURGE_INTERVAL = float(os.getenv("RATE_LIMIT_PURGE_INTERVAL", "300"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def available(self) -> float:
+        """0 if a token can be taken now, otherwise the seconds until one can."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, otherwise the seconds until one is available."""
+        wait = self.available()
+        if not wait:
+            self.tokens -= 1
+        return wait
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: float
+    burst: int
+
+
+def _parse_limit(rate: Optional[str], burst: Optional[str]) -> Optional[Limit]:
+    try:
+        rate = float(rate) if rate else 0.0
+        burst = int(burst) if burst else 0
+    except ValueError:
+        return None
+    if rate <= 0:
+        return None
+    return Limit(rate, max(burst, math.ceil(rate), 1))
+
+
+async def configured_limits(db: AsyncSession, client_code: str) -> Tuple[Optional[Limit], Optional[Limit]]:
+    """(per-client, per-user) limits from the Setting table; None means unlimited.
+
+    RATE_LIMIT_CLIENT_PER_SECOND / _BURST and RATE_LIMIT_USER_PER_SECOND / _BURST apply to every
+    client; a key suffixed with ":<client_code>" overrides it for that client.
+    """
+    keys = [f"RATE_LIMIT_{scope}_{kind}{suffix}"
+            for scope in ("CLIENT", "USER") for kind in ("PER_SECOND", "BURST") for suffix in ("", f":{client_code}")]
+    values = await settings_cache.get_many(db, *keys)
+
+    def setting(scope: str, kind: str) -> Optional[str]:
+        return values[f"RATE_LIMIT_{scope}_{kind}:{client_code}"] or values[f"RATE_LIMIT_{scope}_{kind}"]
+
+    return (_parse_limit(setting("CLIENT", "PER_SECOND"), setting("CLIENT", "BURST")),
+            _parse_limit(setting("USER", "PER_SECOND"), setting("USER", "BURST")))
+
+
+Buckets = List[Tuple[str, Limit]]
+
+
+class MemoryRateLimiter:
+    """Token buckets in this process; with several workers each enforces the limit on its own."""
+
+    def __init__(self, maxsize: int = RATE_LIMIT_CACHE_SIZE):
+        # An evicted bucket just starts full again, which errs on the side of admitting.
+        self._buckets = TTLCache(maxsize, ttl=3600)
+
+    async def take(self, buckets: Buckets) -> Tuple[Optional[int], float]:
+        """Take a token from every bucket or from none of them.
+
+        Returns (None, 0) when admitted, otherwise the index of an empty bucket and the seconds
+        until it has a token again.
+        """
+        ready = []
+        for index, (key, limit) in enumerate(buckets):
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.rate != limit.rate or bucket.burst != limit.burst:
+                bucket = TokenBucket(limit.rate, limit.burst)
+            wait = bucket.available()
+            if wait:
+                return index, wait
+            ready.append((key, bucket))
+        # No await since the checks above, so nothing else can have taken these tokens meanwhile.
+        for key, bucket in ready:
+            bucket.tokens -= 1
+            self._buckets.set(key, bucket)
+        return None, 0.0
+
+
+# GCRA: a token bucket stored as the one timestamp at which it would be full again ("theoretical
+# arrival time"), so taking a token is a single conditional upsert. No row comes back when denied.
+_TAKE = text("""
+    INSERT INTO rate_limits AS r (key, tat)
+    VALUES (:key, now() AT TIME ZONE 'utc' + make_interval(secs => :interval))
+    ON CONFLICT (key) DO UPDATE
+        SET tat = greatest(r.tat, now() AT TIME ZONE 'utc') + make_interval(secs => :interval)
+        WHERE greatest(r.tat, now() AT TIME ZONE 'utc') + make_interval(secs => :interval)
+              <= now() AT TIME ZONE 'utc' + make_interval(secs => :window)
+    RETURNING tat
+""")
+_BACKLOG = text("SELECT extract(epoch FROM tat - now() AT TIME ZONE 'utc') FROM rate_limits WHERE key = :key")
+_PURGE = text("DELETE FROM rate_limits WHERE tat < now() AT TIME ZONE 'utc'")
+
+
+class PostgresRateLimiter:
+    """Buckets shared by every agent worker, kept in the unlogged rate_limits table."""
+
+    def __init__(self):
+        self._purged_at = time.monotonic()
+
+    async def take(self, buckets: Buckets) -> Tuple[Optional[int], float]:
+        """Same contract as MemoryRateLimiter.take: all buckets are taken from, or none."""
+        # Its own short transaction: the row locks must not be held for the rest of the request.
+        # Buckets are always taken in the same order, so concurrent requests can't deadlock.
+        async with async_engine.connect() as conn:
+            if time.monotonic() - self._purged_at > RATE_LIMIT_PURGE_INTERVAL:
+                self._purged_at = time.monotonic()
+                await conn.execute(_PURGE)
+                await conn.commit()
+            for index, (key, limit) in enumerate(buckets):
+                interval = 1 / limit.rate
+                window = limit.burst * interval
+                if not (await conn.execute(_TAKE, {"key": key, "interval": interval, "window": window})).first():
+                    backlog = (await conn.execute(_BACKLOG, {"key": key})).scalar() or 0.0
+                    # Gives back the tokens already taken from the earlier buckets.
+                    await conn.rollback()
+                    return index, max(interval, backlog + interval - window)
+            await conn.commit()
+        return None, 0.0
+
+
+def create_rate_limiter():
+    if RATE_LIMIT_BACKEND == "postgres":
+        return PostgresRateLimiter()
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimiter()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{RATE_LIMIT_BACKEND}'")
+
+
+class Admission:
+    """Per-client and per-(client, user) admission for incoming questions.
+
+    Runs on the raw (client_code, username) before the identity is resolved, so a rejected
+    question never creates a user or conversation. A question takes a token from both its
+    buckets or from neither, so a rejection costs the caller nothing.
+    """
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter or create_rate_limiter()
+
+    async def check(self, db: AsyncSession, client_code: str, username: str) -> float:
+        """0 if the question is admitted, otherwise the seconds to wait before retrying."""
+        client_limit, user_limit = await configured_limits(db, client_code)
+        buckets, scopes = [], []
+        if user_limit is not None:
+            buckets.append((f"user:{client_code}:{username}", user_limit))
+            scopes.append("user")
+        if client_limit is not None:
+            buckets.append((f"client:{client_code}", client_limit))
+            scopes.append("client")
+        if not buckets:
+            return 0.0
+        denied, wait = await self.limiter.take(buckets)
+        if denied is not None:
+            RATE_LIMITED.labels(scope=scopes[denied]).inc()
+        return wait
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+
+admission = Admission()
@@ -0,0 +1,124 @@
+from typing import Optional
+import asyncio
+import time
+import sys
+import os
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.metrics import (
+    WEBHOOK_LATENCY, WEBHOOK_REQUESTS, WEBHOOK_IN_FLIGHT, WEBHOOK_POOL_LIMIT, WEBHOOK_CIRCUIT_OPEN
+)
+
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+WEBHOOK_MAX_KEEPALIVE = int(os.getenv("WEBHOOK_MAX_KEEPALIVE", "20"))
+WEBHOOK_KEEPALIVE_EXPIRY = float(os.getenv("WEBHOOK_KEEPALIVE_EXPIRY", "30"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "30"))
+WEBHOOK_CONNECT_TIMEOUT = float(os.getenv("WEBHOOK_CONNECT_TIMEOUT", "5"))
+WEBHOOK_HTTP2 = os.getenv("WEBHOOK_HTTP2", "false").lower() == "true"
+WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", "3"))
+WEBHOOK_BACKOFF = float(os.getenv("WEBHOOK_BACKOFF", "0.5"))
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))
+WEBHOOK_BREAKER_RESET = float(os.getenv("WEBHOOK_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_progress:
+            return False
+        # Half-open: let a single request through to probe the endpoint.
+        self.trial_in_progress = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        WEBHOOK_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_progress = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            WEBHOOK_CIRCUIT_OPEN.set(1)
+
+
+class WebhookClient:
+    """App-lifetime HTTP client for the n8n webhook, opened and closed by the agent lifespan."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker(WEBHOOK_BREAKER_THRESHOLD, WEBHOOK_BREAKER_RESET)
+
+    async def open(self):
+        self._client = httpx.AsyncClient(
+            http2=WEBHOOK_HTTP2,
+            limits=httpx.Limits(
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                max_keepalive_connections=WEBHOOK_MAX_KEEPALIVE,
+                keepalive_expiry=WEBHOOK_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(WEBHOOK_TIMEOUT, connect=WEBHOOK_CONNECT_TIMEOUT),
+        )
+        WEBHOOK_POOL_LIMIT.set(WEBHOOK_MAX_CONNECTIONS)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        if self._client is None:
+            raise RuntimeError("Webhook client is not open")
+        if not self.breaker.allow():
+            WEBHOOK_REQUESTS.labels(outcome="rejected").inc()
+            raise CircuitOpenError(f"Circuit open for {url}")
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            for attempt in range(WEBHOOK_RETRIES + 1):
+                try:
+                    WEBHOOK_IN_FLIGHT.inc()
+                    try:
+                        response = await self._client.post(url, **kwargs)
+                    finally:
+                        WEBHOOK_IN_FLIGHT.dec()
+                    if response.status_code not in RETRYABLE_STATUS or attempt == WEBHOOK_RETRIES:
+                        response.raise_for_status()
+                        outcome = "success"
+                        self.breaker.record_success()
+                        return response
+                except httpx.TransportError:
+                    if attempt == WEBHOOK_RETRIES:
+                        raise
+                await asyncio.sleep(WEBHOOK_BACKOFF * (2 ** attempt))
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.trial_in_progress = False
+            raise
+        finally:
+            WEBHOOK_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - start)
+            WEBHOOK_REQUESTS.labels(outcome=outcome).inc()
+
+
+webhook_client = WebhookClient()
@@ -0,0 +1,147 @@
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from shared.database import AsyncSessionLocal
+from shared.models import Message, WebhookOutbox
+
+MESSAGE_WRITER = os.getenv("MESSAGE_WRITER", "direct")
+WRITER_FLUSH_MS = float(os.getenv("WRITER_FLUSH_MS", "5"))
+WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "200"))
+
+# One write_many call: its message rows, the outbox entry for each (or None), and the future for their ids.
+PendingWrite = Optional[Tuple[List[dict], List[Optional[dict]], asyncio.Future]]
+NewMessage = Tuple[int, str, str, Optional[dict]]
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[Exception] = None):
+    # The handler may have been cancelled (client went away) while its row was being written.
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class MessageWriter:
+    """Persists Message rows either per request or through a group-commit queue.
+
+    In "batched" mode handlers enqueue their rows and await a future; a single background task
+    inserts everything that arrived within WRITER_FLUSH_MS (or WRITER_BATCH_SIZE rows) in one
+    transaction, so a burst pays for one commit instead of one per message. The rows of one
+    write_many call are never split across transactions.
+
+    An `outbox` row (see outbox.py) is committed in the same transaction as its message, so a
+    question is never stored without its pending webhook delivery or the other way round.
+    """
+
+    def __init__(self, mode: str = MESSAGE_WRITER):
+        self.mode = mode
+        self._queue: Optional["asyncio.Queue[PendingWrite]"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.mode == "batched" and self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # The sentinel goes in behind any queued rows, so they are all written before the task exits.
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    async def write(self, db: AsyncSession, conversation_id: int, role: str, content: str,
+                    outbox: Optional[dict] = None) -> Message:
+        (message,) = await self.write_many(db, [(conversation_id, role, content, outbox)])
+        return message
+
+    async def write_many(self, db: AsyncSession, rows: List[NewMessage]) -> List[Message]:
+        """Write several (conversation_id, role, content, outbox) rows, all in one transaction."""
+        if not rows:
+            return []
+        values = [{"conversation_id": conversation_id, "role": role, "content": content,
+                   "timestamp": datetime.utcnow()} for conversation_id, role, content, _ in rows]
+        if self._task is None:
+            messages = [Message(**row) for row in values]
+            db.add_all(messages)
+            # Flushed first: each outbox row records the id of the question it delivers.
+            await db.flush()
+            db.add_all([WebhookOutbox(**outbox, message_id=message.id)
+                        for message, (_, _, _, outbox) in zip(messages, rows) if outbox is not None])
+            await db.commit()
+            return messages
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((values, [outbox for _, _, _, outbox in rows], future))
+        message_ids = await future
+        return [Message(id=message_id, **row) for message_id, row in zip(message_ids, values)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            size = len(item[0])
+            deadline = loop.time() + WRITER_FLUSH_MS / 1000
+            stopping = False
+            while size < WRITER_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[PendingWrite]):
+        try:
+            ids = await self._insert([row for rows, _, _ in batch for row in rows],
+                                     [entry for _, outbox, _ in batch for entry in outbox])
+        except Exception:
+            # One bad write must not fail its neighbours: fall back to a transaction per write.
+            for rows, outbox, future in batch:
+                try:
+                    _resolve(future, result=await self._insert(rows, outbox))
+                except Exception as e:
+                    _resolve(future, error=e)
+            return
+        start = 0
+        for rows, _, future in batch:
+            _resolve(future, result=ids[start:start + len(rows)])
+            start += len(rows)
+
+    async def _insert(self, rows: List[dict], outbox: List[Optional[dict]]) -> List[int]:
+        """Insert `rows` and the outbox entries aligned with them (None where a row has none)."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+            )
+            ids = list(result.scalars())
+            outbox = [{**entry, "message_id": message_id}
+                      for entry, message_id in zip(outbox, ids) if entry is not None]
+            if outbox:
+                await db.execute(insert(WebhookOutbox), outbox)
+            await db.commit()
+        return ids
+
+
+message_writer = MessageWriter()
@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 import sys
@@ -6,16 +7,14 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
+os.environ.setdefault("DB_SERVICE", "core")
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from shared.database import engine
-from shared.models import Base
-from routers import clients, users, conversations, settings, templates, attributes
+from shared.metrics import MetricsMiddleware, metrics_response
+from routers import clients, users, conversations, settings, templates, attributes, bulk
 
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Core Service")
+app = FastAPI(title="Core Service", default_response_class=ORJSONResponse)
 
 FRONTEND_PORT = os.getenv("FRONTEND_PORT", "3000")
 origins = [
@@ -29,7 +28,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(clients.router, tags=["Clients"])
 app.include_router(users.router, tags=["Users"])
@@ -37,6 +38,13 @@ app.include_router(conversations.router, tags=["Conversations"])
 app.include_router(settings.router, tags=["System Settings"])
 app.include_router(templates.router, tags=["Attribute Templates"])
 app.include_router(attributes.router, tags=["Client Attributes"])
+app.include_router(bulk.router, tags=["Bulk Import/Export"])
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
 
 if __name__ == "__main__":
     import uvicorn
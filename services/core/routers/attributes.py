@@ -7,8 +7,10 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
+from shared.database import get_db, get_read_db
+from shared.context_cache import notify_client_context_changed
 from shared.models import Attribute, Template
+from shared.pagination import PageParams, list_response
 
 router = APIRouter()
 
@@ -24,24 +26,21 @@ class AttributeUpdate(BaseModel):
 
 
 @router.get("/attributes/{client_id}", response_model=List[dict])
-def get_client_attributes(client_id: int, db: Session = Depends(get_db)):
-    attributes = db.query(Attribute).filter(Attribute.client_id == client_id).all()
-
-    result = []
-    for attr in attributes:
-        template = db.query(Template).filter(Template.id == attr.template_id).first()
-        if template:
-            result.append({
-                "id": attr.id,
-                "client_id": attr.client_id,
-                "template_id": attr.template_id,
-                "key": template.key,
-                "value": attr.value,
-                "description": template.description,
-                "data_type": template.data_type,
-                "updated_at": attr.updated_at.isoformat()
-            })
-    return result
+def get_client_attributes(client_id: int, page: PageParams = Depends(),
+                          db: Session = Depends(get_read_db)):
+    query = db.query(Attribute, Template).join(Template, Attribute.template_id == Template.id).filter(
+        Attribute.client_id == client_id
+    )
+    return list_response(db, query, Attribute.id, lambda row: {
+        "id": row.Attribute.id,
+        "client_id": row.Attribute.client_id,
+        "template_id": row.Attribute.template_id,
+        "key": row.Template.key,
+        "value": row.Attribute.value,
+        "description": row.Template.description,
+        "data_type": row.Template.data_type,
+        "updated_at": row.Attribute.updated_at
+    }, page, cursor_of=lambda row: row.Attribute.id)
 
 
 @router.post("/attributes", response_model=dict)
@@ -59,6 +58,7 @@ def set_client_attribute(attribute_data: AttributeCreate, db: Session = Depends(
         attribute = Attribute(**attribute_data.dict())
         db.add(attribute)
 
+    notify_client_context_changed(db, attribute_data.client_id)
     db.commit()
     db.refresh(attribute)
 
@@ -0,0 +1,205 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, Dict, List, Tuple
+import csv
+import io
+import json
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from shared.context_cache import notify_client_context_changed
+from shared.database import get_db, get_read_db
+from shared.identity_cache import notify_identity_changed
+from shared.models import Client, Attribute, Template, User
+from shared.pagination import stream_response
+from shared.upserts import BULK_CHUNK_SIZE, upsert_clients, upsert_attributes, upsert_users
+
+router = APIRouter(prefix="/bulk")
+
+EXPORT_FORMAT = Query("ndjson", pattern="^(csv|ndjson)$")
+
+# The (row number, fields) pairs of an upload, and the per-row errors found while parsing it.
+Upload = Tuple[List[Tuple[int, dict]], List[dict]]
+
+
+async def read_rows(request: Request) -> Upload:
+    """Parse a CSV (Content-Type: text/csv) or NDJSON upload into (row number, fields) pairs."""
+    body = (await request.body()).decode("utf-8-sig")
+    if request.headers.get("content-type", "").startswith("text/csv"):
+        # Row 1 is the header line.
+        return [(number, row) for number, row in enumerate(csv.DictReader(io.StringIO(body)), start=2)], []
+
+    rows = []
+    errors = []
+    for number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Row {number}: invalid JSON ({e.msg})")
+        if isinstance(row, dict):
+            rows.append((number, row))
+        else:
+            errors.append({"row": number, "error": f"Expected a JSON object, got {type(row).__name__}"})
+    return rows, errors
+
+
+def _required(row: dict, *fields: str) -> List[str]:
+    return [field for field in fields if not str(row.get(field) or "").strip()]
+
+
+def _load(db: Session, upload: Upload, prepare: Callable, upsert: Callable) -> dict:
+    rows, errors = upload
+    errors = list(errors)
+    valid: Dict[tuple, Tuple[int, dict]] = {}
+    for number, row in rows:
+        key, values, error = prepare(row)
+        if error:
+            errors.append({"row": number, "error": error})
+        else:
+            # The same key twice in one statement would make ON CONFLICT fail; the last row wins.
+            valid[key] = (number, values)
+
+    loaded = 0
+    pending = list(valid.values())
+    for i in range(0, len(pending), BULK_CHUNK_SIZE):
+        chunk = pending[i:i + BULK_CHUNK_SIZE]
+        try:
+            with db.begin_nested():
+                loaded += upsert(db, [values for _, values in chunk])
+        except SQLAlchemyError:
+            # Only this chunk's savepoint is rolled back; retry it row by row to find the offending rows.
+            for number, values in chunk:
+                try:
+                    with db.begin_nested():
+                        loaded += upsert(db, [values])
+                except SQLAlchemyError as e:
+                    errors.append({"row": number, "error": str(getattr(e, "orig", e))})
+
+    try:
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Bulk load rolled back: {getattr(e, 'orig', e)}")
+
+    return {"loaded": loaded, "errors": sorted(errors, key=lambda error: error["row"])}
+
+
+def _import_clients(db: Session, upload: Upload) -> dict:
+    names = dict(db.query(Client.name, Client.client_code).all())
+
+    def prepare(row):
+        missing = _required(row, "client_code", "name")
+        if missing:
+            return None, None, f"Missing {', '.join(missing)}"
+        owner = names.get(row["name"])
+        if owner is not None and owner != row["client_code"]:
+            return None, None, f"Name '{row['name']}' already belongs to client '{owner}'"
+        names[row["name"]] = row["client_code"]
+        return row["client_code"], {
+            "client_code": row["client_code"],
+            "name": row["name"],
+            "status": row.get("status") or "Activo"
+        }, None
+
+    # Client names appear in the prompt context; the notification is delivered only if the load commits.
+    notify_client_context_changed(db)
+    notify_identity_changed(db)
+    return _load(db, upload, prepare, upsert_clients)
+
+
+def _import_attributes(db: Session, upload: Upload) -> dict:
+    clients = dict(db.query(Client.client_code, Client.id).all())
+    templates = dict(db.query(Template.key, Template.id).all())
+
+    def prepare(row):
+        missing = _required(row, "client_code", "template_key") + ([] if row.get("value") is not None else ["value"])
+        if missing:
+            return None, None, f"Missing {', '.join(missing)}"
+        client_id = clients.get(row["client_code"])
+        if client_id is None:
+            return None, None, f"Unknown client_code '{row['client_code']}'"
+        template_id = templates.get(row["template_key"])
+        if template_id is None:
+            return None, None, f"Unknown template_key '{row['template_key']}'"
+        return (client_id, template_id), {
+            "client_id": client_id,
+            "template_id": template_id,
+            "value": str(row["value"])
+        }, None
+
+    notify_client_context_changed(db)
+    return _load(db, upload, prepare, upsert_attributes)
+
+
+def _import_users(db: Session, upload: Upload) -> dict:
+    clients = dict(db.query(Client.client_code, Client.id).all())
+
+    def prepare(row):
+        missing = _required(row, "username", "client_code")
+        if missing:
+            return None, None, f"Missing {', '.join(missing)}"
+        client_id = clients.get(row["client_code"])
+        if client_id is None:
+            return None, None, f"Unknown client_code '{row['client_code']}'"
+        return (client_id, row["username"]), {
+            "username": row["username"],
+            "client_id": client_id,
+            "status": row.get("status") or "Activo"
+        }, None
+
+    return _load(db, upload, prepare, upsert_users)
+
+
+@router.post("/clients", response_model=dict)
+async def import_clients(request: Request, db: Session = Depends(get_db)):
+    return await run_in_threadpool(_import_clients, db, await read_rows(request))
+
+
+@router.post("/attributes", response_model=dict)
+async def import_attributes(request: Request, db: Session = Depends(get_db)):
+    return await run_in_threadpool(_import_attributes, db, await read_rows(request))
+
+
+@router.post("/users", response_model=dict)
+async def import_users(request: Request, db: Session = Depends(get_db)):
+    return await run_in_threadpool(_import_users, db, await read_rows(request))
+
+
+@router.get("/clients")
+def export_clients(format: str = EXPORT_FORMAT, db: Session = Depends(get_read_db)):
+    query = db.query(Client).order_by(Client.id)
+    return stream_response(db, query, lambda c: {
+        "client_code": c.client_code,
+        "name": c.name,
+        "status": c.status
+    }, format)
+
+
+@router.get("/attributes")
+def export_attributes(format: str = EXPORT_FORMAT, db: Session = Depends(get_read_db)):
+    query = db.query(Client.client_code, Template.key, Attribute.value).select_from(Attribute).join(
+        Client, Attribute.client_id == Client.id
+    ).join(Template, Attribute.template_id == Template.id).order_by(Attribute.id)
+    return stream_response(db, query, lambda row: {
+        "client_code": row.client_code,
+        "template_key": row.key,
+        "value": row.value
+    }, format)
+
+
+@router.get("/users")
+def export_users(format: str = EXPORT_FORMAT, db: Session = Depends(get_read_db)):
+    query = db.query(User.username, Client.client_code, User.status).join(
+        Client, User.client_id == Client.id
+    ).order_by(User.id)
+    return stream_response(db, query, lambda row: {
+        "username": row.username,
+        "client_code": row.client_code,
+        "status": row.status
+    }, format)
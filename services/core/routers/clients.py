@@ -7,8 +7,12 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
-from shared.models import Client, Attribute, Template
+from shared.database import get_db, get_read_db
+from shared.context_cache import notify_client_context_changed
+from shared.identity_cache import notify_identity_changed
+from shared.models import Client
+from shared.pagination import PageParams, list_response
+from shared.upserts import upsert_attributes
 
 router = APIRouter()
 
@@ -35,18 +39,14 @@ class StatusUpdate(BaseModel):
 
 
 @router.get("/clients", response_model=List[dict])
-def get_clients(db: Session = Depends(get_db)):
-    clients = db.query(Client).all()
-    return [
-        {
-            "id": c.id,
-            "client_code": c.client_code,
-            "name": c.name,
-            "status": c.status,
-            "created_at": c.created_at.isoformat()
-        }
-        for c in clients
-    ]
+def get_clients(page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    return list_response(db, db.query(Client), Client.id, lambda c: {
+        "id": c.id,
+        "client_code": c.client_code,
+        "name": c.name,
+        "status": c.status,
+        "created_at": c.created_at
+    }, page)
 
 
 @router.post("/clients", response_model=dict)
@@ -61,17 +61,15 @@ def create_client(client_data: ClientCreate, db: Session = Depends(get_db)):
 
     db_client = Client(client_code=client_data.client_code, name=client_data.name, status='Activo')
     db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
+    db.flush()
 
-    for attr_data in client_data.attributes:
-        attribute = Attribute(
-            client_id=db_client.id,
-            template_id=attr_data.template_id,
-            value=attr_data.value
-        )
-        db.add(attribute)
+    if client_data.attributes:
+        upsert_attributes(db, [
+            {"client_id": db_client.id, "template_id": attr_data.template_id, "value": attr_data.value}
+            for attr_data in client_data.attributes
+        ])
     db.commit()
+    db.refresh(db_client)
 
     return {
         "id": db_client.id,
@@ -93,24 +91,16 @@ def update_client(client_code: str, client_data: ClientUpdate, db: Session = Dep
     if client_data.status is not None:
         db_client.status = client_data.status
 
-    db.commit()
+    if client_data.attributes:
+        upsert_attributes(db, [
+            {"client_id": db_client.id, "template_id": attr_data.template_id, "value": attr_data.value}
+            for attr_data in client_data.attributes
+        ])
 
-    if client_data.attributes is not None:
-        for attr_data in client_data.attributes:
-            attribute = db.query(Attribute).filter(
-                Attribute.client_id == db_client.id,
-                Attribute.template_id == attr_data.template_id
-            ).first()
-            if attribute:
-                attribute.value = attr_data.value
-            else:
-                new_attribute = Attribute(
-                    client_id=db_client.id,
-                    template_id=attr_data.template_id,
-                    value=attr_data.value
-                )
-                db.add(new_attribute)
-        db.commit()
+    notify_client_context_changed(db, db_client.id)
+    # Cached agent identities carry the client's name and were resolved while it was active.
+    notify_identity_changed(db, db_client.id)
+    db.commit()
 
     db.refresh(db_client)
     return {
@@ -129,6 +119,7 @@ def update_client_status(client_code: str, status_update: StatusUpdate, db: Sess
         raise HTTPException(status_code=404, detail="Client not found")
 
     db_client.status = status_update.status
+    notify_identity_changed(db, db_client.id)
     db.commit()
     db.refresh(db_client)
     return {
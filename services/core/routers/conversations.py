@@ -8,8 +8,10 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
+from shared.database import get_db, get_read_db
 from shared.models import Conversation
+from shared.pagination import PageParams, list_response
+from shared.resolution import resolve_today_conversation
 
 router = APIRouter()
 
@@ -34,25 +36,20 @@ def create_conversation(conversation: ConversationCreate, db: Session = Depends(
     return db_conversation
 
 @router.get("/conversations/{user_id}", response_model=List[ConversationResponse])
-def get_user_conversations(user_id: int, db: Session = Depends(get_db)):
-    conversations = db.query(Conversation).filter(Conversation.user_id == user_id).all()
-    return conversations
+def get_user_conversations(user_id: int, page: PageParams = Depends(),
+                           db: Session = Depends(get_read_db)):
+    query = db.query(Conversation).filter(Conversation.user_id == user_id)
+    return list_response(db, query, Conversation.id, lambda c: {
+        "id": c.id,
+        "user_id": c.user_id,
+        "title": c.title,
+        "created_at": c.created_at,
+        "updated_at": c.updated_at
+    }, page)
 
 @router.get("/conversations/today/{user_id}", response_model=ConversationResponse)
 def get_or_create_today_conversation(user_id: int, db: Session = Depends(get_db)):
-    today = date.today()
-    conversation = db.query(Conversation).filter(
-        Conversation.user_id == user_id,
-        Conversation.created_at >= today
-    ).first()
-
-    if not conversation:
-        conversation = Conversation(
-            user_id=user_id,
-            title=f"Conversación {today.strftime('%d/%m/%Y')}"
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-
-    return conversation
\ No newline at end of file
+    conversation_id = resolve_today_conversation(db, user_id, date.today())
+    if conversation_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db.get(Conversation, conversation_id)
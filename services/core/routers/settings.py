@@ -7,8 +7,10 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
+from shared.database import get_db, get_read_db
 from shared.models import Setting
+from shared.pagination import PageParams, list_response
+from shared.settings_cache import notify_settings_changed
 
 router = APIRouter()
 
@@ -18,9 +20,9 @@ class SettingCreate(BaseModel):
     description: str
 
 @router.get("/settings", response_model=List[dict])
-def get_all_settings(db: Session = Depends(get_db)):
-    settings = db.query(Setting).all()
-    return [{"key": s.key, "value": s.value, "description": s.description} for s in settings]
+def get_all_settings(page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    return list_response(db, db.query(Setting), Setting.id,
+                         lambda s: {"key": s.key, "value": s.value, "description": s.description}, page)
 
 @router.post("/settings", response_model=dict)
 def set_setting(setting_data: SettingCreate, db: Session = Depends(get_db)):
@@ -31,6 +33,7 @@ def set_setting(setting_data: SettingCreate, db: Session = Depends(get_db)):
     else:
         setting = Setting(**setting_data.dict())
         db.add(setting)
+    notify_settings_changed(db)
     db.commit()
     db.refresh(setting)
     return {"key": setting.key, "value": setting.value, "description": setting.description}
@@ -47,5 +50,7 @@ def init_settings(db: Session = Depends(get_db)):
             setting = Setting(**default)
             db.add(setting)
             created.append(default["key"])
+    if created:
+        notify_settings_changed(db)
     db.commit()
     return {"created": created}
\ No newline at end of file
@@ -7,8 +7,10 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
+from shared.database import get_db, get_read_db
+from shared.context_cache import notify_client_context_changed
 from shared.models import Template
+from shared.pagination import PageParams, list_response
 
 router = APIRouter()
 
@@ -28,18 +30,14 @@ class StatusUpdate(BaseModel):
     status: str
 
 @router.get("/templates", response_model=List[dict])
-def get_all_templates(db: Session = Depends(get_db)):
-    templates = db.query(Template).all()
-    return [
-        {
-            "id": t.id,
-            "key": t.key,
-            "description": t.description,
-            "data_type": t.data_type,
-            "status": t.status
-        }
-        for t in templates
-    ]
+def get_all_templates(page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    return list_response(db, db.query(Template), Template.id, lambda t: {
+        "id": t.id,
+        "key": t.key,
+        "description": t.description,
+        "data_type": t.data_type,
+        "status": t.status
+    }, page)
 
 @router.post("/templates", response_model=dict)
 def create_template(template: TemplateCreate, db: Session = Depends(get_db)):
@@ -65,6 +63,7 @@ def update_template(template_id: int, template_data: TemplateUpdate, db: Session
     for key, value in update_data.items():
         setattr(db_template, key, value)
 
+    notify_client_context_changed(db)
     db.commit()
     db.refresh(db_template)
     return {
@@ -1,18 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import Session
+from datetime import timedelta
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import date
 import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from shared.database import get_db
+from shared.database import get_db, get_read_db
 from shared.models import User, Client, Conversation, Message
+from shared.pagination import PageParams, list_response
+from shared.partitions import messages_since
+from shared.resolution import resolve
 
 router = APIRouter()
 
+# Message ids are drawn at insert but become visible at commit, so a lower id can commit after a
+# higher one was already pushed. Resuming re-sends everything written this long before `after`.
+RESUME_OVERLAP_SECONDS = float(os.getenv("RESUME_OVERLAP_SECONDS", "60"))
+
 
 class UserAccessRequest(BaseModel):
     username: str
@@ -20,84 +30,102 @@ class UserAccessRequest(BaseModel):
 
 
 @router.get("/users", response_model=List[dict])
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return [
-        {
-            "id": user.id,
-            "username": user.username,
-            "status": user.status,
-            "created_at": user.created_at.isoformat(),
-            "client_id": user.client_id,
-            "client_code": user.client.client_code if user.client else "N/A",
-            "client_name": user.client.name if user.client else "N/A"
-        }
-        for user in users
-    ]
+def get_all_users(page: PageParams = Depends(), db: Session = Depends(get_read_db)):
+    query = db.query(User).options(joinedload(User.client))
+    return list_response(db, query, User.id, lambda user: {
+        "id": user.id,
+        "username": user.username,
+        "status": user.status,
+        "created_at": user.created_at,
+        "client_id": user.client_id,
+        "client_code": user.client.client_code if user.client else "N/A",
+        "client_name": user.client.name if user.client else "N/A"
+    }, page)
 
 
 @router.get("/clients/{client_code}/users", response_model=List[dict])
-def get_users_for_client(client_code: str, db: Session = Depends(get_db)):
+def get_users_for_client(client_code: str, page: PageParams = Depends(),
+                         db: Session = Depends(get_read_db)):
     client = db.query(Client).filter(Client.client_code == client_code).first()
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    users = db.query(User).filter(User.client_id == client.id).all()
-    return [
-        {
-            "id": user.id,
-            "username": user.username
-        }
-        for user in users
-    ]
+    query = db.query(User).filter(User.client_id == client.id)
+    return list_response(db, query, User.id, lambda user: {
+        "id": user.id,
+        "username": user.username
+    }, page)
 
 
 @router.get("/load_conversation", response_model=dict)
-def load_conversation(client_code: str, username: str, db: Session = Depends(get_db)):
-    client = db.query(Client).filter(Client.client_code == client_code, Client.status == 'Activo').first()
-    if not client:
+def load_conversation(client_code: str, username: str, db: Session = Depends(get_db),
+                      replica: Session = Depends(get_read_db)):
+    # Resolving upserts the user, so it runs on the primary; the history is read from the replica.
+    resolved = resolve(db, client_code, username, active_only=True)
+    if resolved is None:
         raise HTTPException(status_code=404, detail=f"Cliente con código '{client_code}' no encontrado o inactivo.")
 
-    user = db.query(User).filter(User.username == username, User.client_id == client.id).first()
-
-    if not user:
-        user = User(username=username, client_id=client.id)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
-    today = date.today()
-    conversation = db.query(Conversation).filter(
-        Conversation.user_id == user.id,
-        Conversation.created_at >= today
-    ).first()
-
-    if not conversation:
-        conversation = db.query(Conversation).filter(
-            Conversation.user_id == user.id
-        ).order_by(Conversation.created_at.desc()).first()
+    # Today's conversation if there is one, otherwise the latest; opening the chat doesn't create one.
+    conversation = replica.query(Conversation).filter(
+        Conversation.user_id == resolved.user_id
+    ).order_by(Conversation.created_at.desc()).first()
 
     messages = []
     conversation_id = None
     if conversation:
         conversation_id = conversation.id
-        messages = db.query(Message).filter(Message.conversation_id == conversation.id).order_by(
-            Message.timestamp).all()
-
-    return {
-        "user_id": user.id,
-        "username": user.username,
-        "client_id": user.client_id,
-        "client_code": user.client.client_code,
-        "client_name": user.client.name,
+        messages = replica.query(Message).filter(
+            Message.conversation_id == conversation.id,
+            messages_since(conversation.created_at)
+        ).order_by(Message.timestamp).all()
+
+    return ORJSONResponse({
+        "user_id": resolved.user_id,
+        "username": resolved.username,
+        "client_id": resolved.client_id,
+        "client_code": resolved.client_code,
+        "client_name": resolved.client_name,
         "conversation_id": conversation_id,
         "messages": [
             {
                 "id": msg.id,
+                "seq": msg.id,
+                "conversation_id": msg.conversation_id,
                 "role": msg.role,
                 "content": msg.content,
-                "timestamp": msg.timestamp.isoformat()
+                "timestamp": msg.timestamp
             }
             for msg in messages
         ]
-    }
\ No newline at end of file
+    })
+
+
+@router.get("/users/{user_id}/messages", response_model=List[dict])
+def resume_messages(user_id: int, after: int = 0, limit: int = Query(500, ge=1, le=1000),
+                    db: Session = Depends(get_db)):
+    # `after` is the last `seq` the client saw; spans conversations so a reconnect across midnight catches up too.
+    # `limit` caps only the messages after it, so a full page always moves the client forward; the
+    # overlap window comes on top, and the client drops the ids it already has.
+    conversations = db.query(Conversation.id).filter(Conversation.user_id == user_id)
+    after_timestamp = select(Message.timestamp).where(Message.id == after).limit(1).scalar_subquery()
+    overlap = db.query(Message).filter(
+        Message.conversation_id.in_(conversations),
+        Message.id <= after,
+        Message.timestamp >= after_timestamp - timedelta(seconds=RESUME_OVERLAP_SECONDS)
+    ).order_by(Message.id).all()
+    newer = db.query(Message).filter(
+        Message.conversation_id.in_(conversations),
+        Message.id > after
+    ).order_by(Message.id).limit(limit).all()
+    messages = overlap + newer
+    return ORJSONResponse([
+        {
+            "id": msg.id,
+            "seq": msg.id,
+            "conversation_id": msg.conversation_id,
+            "role": msg.role,
+            "content": msg.content,
+            "timestamp": msg.timestamp
+        }
+        for msg in messages
+    ])
@@ -43,11 +43,12 @@ def main():
     print("\n✅ Configuración completada!")
     print("\n📋 Próximos pasos:")
     print("1. Asegúrate de que PostgreSQL esté corriendo")
-    print("2. Ejecuta: python start_dev.py")
+    print("2. Ejecuta: python start_dev.py (aplica las migraciones con alembic upgrade head)")
     print("\n📁 Estructura del proyecto:")
     print("- /services/ - Microservicios Python")
     print("- /frontend/ - Aplicación React")
     print("- /shared/ - Código compartido (modelos, DB)")
+    print("- /migrations/ - Migraciones de base de datos (Alembic)")
     print("- requirements.txt - Dependencias Python unificadas")
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+import os
+
+from shared.cache import TTLCache
+from shared.models import Attribute, Template
+from shared.notify import notify
+
+CLIENT_CONTEXT_CHANNEL = "client_context_changed"
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "10000"))
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "300"))
+
+
+def notify_client_context_changed(db: Session, client_id: Optional[int] = None):
+    # An empty payload means every client is affected (e.g. a template description changed).
+    notify(db, CLIENT_CONTEXT_CHANNEL, "" if client_id is None else str(client_id))
+
+
+def render_client_context(client_name: str, attributes) -> str:
+    context_parts = [f"Contexto de la empresa {client_name}:"]
+    for description, value in attributes:
+        context_parts.append(f"- {description}: {value}")
+    return "\n".join(context_parts)
+
+
+class ClientContextCache:
+    """Rendered "Contexto de la empresa" blocks keyed by client_id."""
+
+    def __init__(self, maxsize: int = CONTEXT_CACHE_SIZE, ttl: float = CONTEXT_CACHE_TTL):
+        self._cache = TTLCache(maxsize, ttl)
+        self._generation = 0
+
+    def invalidate(self, payload: Optional[str] = None):
+        self._generation += 1
+        if payload:
+            self._cache.pop(int(payload))
+        else:
+            self._cache.clear()
+
+    async def get(self, db: AsyncSession, client_id: int, client_name: str) -> str:
+        context = self._cache.get(client_id)
+        if context is None:
+            generation = self._generation
+            attributes = await db.execute(
+                select(Template.description, Attribute.value)
+                .join(Template, Attribute.template_id == Template.id)
+                .where(Attribute.client_id == client_id)
+                .order_by(Attribute.id)
+            )
+            context = render_client_context(client_name, attributes)
+            # Don't cache a rendering that an invalidation raced past while we were querying.
+            if generation == self._generation:
+                self._cache.set(client_id, context)
+        return context
+
+
+client_context_cache = ClientContextCache()
@@ -0,0 +1,100 @@
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+import os
+
+from shared.cache import TTLCache
+from shared.metrics import IDENTITY_CACHE_LOOKUPS
+from shared.models import Client, User, Conversation
+from shared.notify import notify
+from shared.resolution import Resolution, resolve_async
+
+IDENTITY_CHANNEL = "identity_changed"
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "50000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "3600"))
+
+
+def notify_identity_changed(db: Session, client_id: Optional[int] = None):
+    # An empty payload drops every cached identity.
+    notify(db, IDENTITY_CHANNEL, "" if client_id is None else str(client_id))
+
+
+class IdentityCache:
+    """Resolutions of the agent endpoints' callers, keyed per day.
+
+    /question entries are keyed by (client_code, username, day), so the first message after midnight
+    misses and creates the new daily conversation. /answer entries are keyed by (user_id, client_code,
+    day) and only cached once the latest conversation is that day's one: until then a /question may
+    still create a newer conversation the answer has to go to.
+    """
+
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL):
+        self._questions = TTLCache(maxsize, ttl)
+        self._answers = TTLCache(maxsize, ttl)
+        self._generation = 0
+
+    @property
+    def hits(self) -> int:
+        return self._questions.hits + self._answers.hits
+
+    @property
+    def misses(self) -> int:
+        return self._questions.misses + self._answers.misses
+
+    def invalidate(self, payload: Optional[str] = None):
+        self._generation += 1
+        if payload:
+            client_id = int(payload)
+            for cache in (self._questions, self._answers):
+                cache.discard_if(lambda key, resolved: resolved.client_id == client_id)
+        else:
+            self._questions.clear()
+            self._answers.clear()
+
+    async def question(self, db: AsyncSession, client_code: str, username: str,
+                       day: date) -> Optional[Resolution]:
+        key = (client_code, username, day)
+        resolved = self._questions.get(key)
+        IDENTITY_CACHE_LOOKUPS.labels("question", "miss" if resolved is None else "hit").inc()
+        if resolved is None:
+            generation = self._generation
+            resolved = await resolve_async(db, client_code, username, day, active_only=True)
+            if resolved is not None and generation == self._generation:
+                self._questions.set(key, resolved)
+                # The answer to this question goes to the same, now current, conversation.
+                self._answers.set((resolved.user_id, client_code, day), resolved)
+        return resolved
+
+    async def answer(self, db: AsyncSession, user_id: int, client_code: str, day: date) -> Optional[Resolution]:
+        """The user (checked against client_code) with their latest conversation, or None if unknown."""
+        key = (user_id, client_code, day)
+        resolved = self._answers.get(key)
+        IDENTITY_CACHE_LOOKUPS.labels("answer", "miss" if resolved is None else "hit").inc()
+        if resolved is not None:
+            return resolved
+
+        generation = self._generation
+        row = (await db.execute(
+            select(User.id, User.username, Client.id.label("client_id"), Client.client_code,
+                   Client.name, Conversation.id.label("conversation_id"), Conversation.created_at,
+                   Conversation.conversation_date)
+            .join(Client, User.client_id == Client.id)
+            .outerjoin(Conversation, Conversation.user_id == User.id)
+            .where(User.id == user_id, Client.client_code == client_code)
+            .order_by(Conversation.created_at.desc())
+            .limit(1)
+        )).first()
+        if row is None:
+            return None
+
+        resolved = Resolution(user_id=row.id, username=row.username, client_id=row.client_id,
+                              client_code=row.client_code, client_name=row.name,
+                              conversation_id=row.conversation_id, conversation_started_at=row.created_at)
+        if row.conversation_date == day and generation == self._generation:
+            self._answers.set(key, resolved)
+        return resolved
+
+
+identity_cache = IdentityCache()
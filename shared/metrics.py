@@ -0,0 +1,180 @@
+from contextvars import ContextVar
+from fastapi import Response
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+from typing import Dict, Optional
+import time
+
+WEBHOOK_LATENCY = Histogram(
+    "webhook_request_duration_seconds",
+    "Latency of calls to the n8n agent webhook, including retries.",
+    ["outcome"],
+)
+WEBHOOK_REQUESTS = Counter(
+    "webhook_requests_total",
+    "Calls to the n8n agent webhook by outcome.",
+    ["outcome"],
+)
+WEBHOOK_IN_FLIGHT = Gauge(
+    "webhook_in_flight_requests",
+    "Webhook requests currently holding a connection from the shared HTTP pool.",
+)
+WEBHOOK_POOL_LIMIT = Gauge(
+    "webhook_pool_max_connections",
+    "Configured connection limit of the shared webhook HTTP pool.",
+)
+WEBHOOK_CIRCUIT_OPEN = Gauge(
+    "webhook_circuit_open",
+    "1 while the webhook circuit breaker is rejecting calls.",
+)
+OUTBOX_DELIVERIES = Counter(
+    "webhook_outbox_deliveries_total",
+    "Webhook outbox delivery attempts by outcome (delivered, retried, dead, throttled, skipped).",
+    ["outcome"],
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Questions rejected with 429 by the agent's rate limiter, by the limit that was hit.",
+    ["scope"],
+)
+IDENTITY_CACHE_LOOKUPS = Counter(
+    "identity_cache_lookups_total",
+    "Agent identity cache lookups by endpoint and result (hit or miss).",
+    ["endpoint", "result"],
+)
+
+PROMPT_BUILD_DURATION = Histogram(
+    "prompt_build_duration_seconds",
+    "Time spent rendering the webhook prompt.",
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1),
+)
+PROMPT_SIZE = Histogram(
+    "prompt_size_chars",
+    "Length of the rendered webhook prompt in characters.",
+    buckets=(256, 1024, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_active_connections",
+    "WebSocket connections currently open on this worker.",
+)
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status.",
+    ["route", "method", "status"],
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "Number of SQL statements executed while serving a request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent in SQL statements while serving a request.",
+    ["route"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Latency of individual SQL statements by engine.",
+    ["engine"],
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the SQLAlchemy pool.",
+    ["engine"],
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections open beyond the pool size (negative while the pool is not yet full).",
+    ["engine"],
+)
+
+
+class _QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set per request by MetricsMiddleware; sync routes see it too because the threadpool copies the context.
+_query_stats: ContextVar[Optional[_QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement on `engine` (a sync Engine or an AsyncEngine) and export its pool usage."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    duration = DB_QUERY_DURATION.labels(name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        duration.observe(elapsed)
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+        DB_POOL_OVERFLOW.labels(name).set_function(pool.overflow)
+
+
+class MetricsMiddleware:
+    """Per-route request latency plus the number and total time of SQL statements behind each request."""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        # Label by path template, never by raw path, so ids in URLs don't explode the series count.
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            route = next((r.path for r in scope["app"].routes if getattr(r, "endpoint", None) is endpoint),
+                         "unmatched")
+            self._routes[endpoint] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = _QueryStats()
+        token = _query_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _query_stats.reset(token)
+            route = self._route(scope)
+            HTTP_REQUEST_LATENCY.labels(route, scope["method"], str(status)).observe(time.perf_counter() - start)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import (
+    Column, BigInteger, Integer, String, Date, DateTime, Text, JSON, ForeignKey, Index, UniqueConstraint, text
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -44,6 +46,9 @@ class Client(Base):
 
 class Attribute(Base):
     __tablename__ = "attributes"
+    __table_args__ = (
+        UniqueConstraint("client_id", "template_id", name="uq_attributes_client_id_template_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
@@ -57,9 +62,13 @@ class Attribute(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_client_id", "client_id"),
+        UniqueConstraint("client_id", "username", name="uq_users_client_id_username"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True, nullable=False)
+    username = Column(String, index=True, nullable=False)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     status = Column(String, nullable=False, default='Activo')
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -70,11 +79,17 @@ class User(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at"),
+        UniqueConstraint("user_id", "conversation_date", name="uq_conversations_user_id_conversation_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     title = Column(String, nullable=False)
+    # The day this is the user's daily conversation for; NULL for conversations created by hand.
+    conversation_date = Column(Date, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -85,11 +100,48 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_id_timestamp", "conversation_id", "timestamp"),
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Partitioned by month on timestamp (see shared/partitions.py), which must be part of the key.
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+    conversation = relationship("Conversation", back_populates="messages")
+
 
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+class WebhookOutbox(Base):
+    """A question waiting to be delivered to the n8n webhook, written with the user's Message."""
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (
+        Index("ix_webhook_outbox_pending_next_attempt_at", "next_attempt_at",
+              postgresql_where=text("status = 'pending'")),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    # The Resolution the dispatch is snapshotted from (see services/agent/outbox.py).
+    payload = Column(JSON, nullable=False)
+    # The question being delivered; its history stops there. No foreign key, since messages is partitioned.
+    message_id = Column(Integer, nullable=False)
+    # 'pending' until delivered (the row is then deleted) or 'dead' once out of attempts.
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RateLimit(Base):
+    """Shared rate-limiter state (see services/agent/ratelimit.py); unlogged, since losing it only resets limits."""
+    __tablename__ = "rate_limits"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = Column(String, primary_key=True)
+    # When the bucket would be full again; GCRA's "theoretical arrival time".
+    tat = Column(DateTime, nullable=False)
@@ -0,0 +1,78 @@
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, Optional
+import asyncio
+import os
+
+from shared.database import ASYNC_DATABASE_URL
+
+LISTENER_RETRY_SECONDS = float(os.getenv("LISTENER_RETRY_SECONDS", "5"))
+
+
+def notify(db: Session, channel: str, payload: str = ""):
+    # pg_notify is transactional: listeners only hear about it once the caller commits.
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+def _listener_dsn() -> str:
+    return make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class PgListener:
+    """Keeps one dedicated connection LISTENing on a set of channels and dispatches payloads to callbacks.
+
+    Callbacks receive the NOTIFY payload, or None after a (re)connect, when notifications may have been missed.
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, Callable[[Optional[str]], None]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[str]], None]):
+        self._callbacks[channel] = callback
+
+    def start(self):
+        if self._task is None and self._callbacks:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notification(self, connection, pid, channel, payload):
+        callback = self._callbacks.get(channel)
+        if callback:
+            callback(payload)
+
+    async def _run(self):
+        import asyncpg
+
+        failing = False
+        while True:
+            try:
+                connection = await asyncpg.connect(_listener_dsn())
+                try:
+                    for channel in self._callbacks:
+                        await connection.add_listener(channel, self._on_notification)
+                    for callback in self._callbacks.values():
+                        callback(None)
+                    if failing:
+                        print("Postgres listener reconnected")
+                        failing = False
+                    while not connection.is_closed():
+                        await asyncio.sleep(LISTENER_RETRY_SECONDS)
+                finally:
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not failing:
+                    print(f"Postgres listener unavailable, relying on polling: {e}")
+                    failing = True
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
@@ -0,0 +1,81 @@
+from fastapi import Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Optional
+import csv
+import io
+import os
+import orjson
+
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Keyset pagination shared by the list routes.
+
+    `after` is the id of the last row already seen; a full page sets X-Next-Cursor to the value
+    to pass as `after` next. Without `limit` the whole list is returned, as before.
+    `format=ndjson` streams every matching row as newline-delimited JSON in constant memory.
+    """
+
+    def __init__(self,
+                 limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+                 after: int = Query(0, ge=0),
+                 format: str = Query("json", pattern="^(json|ndjson)$")):
+        self.limit = limit
+        self.after = after
+        self.format = format
+
+
+def _stream_rows(query, serialize: Callable[[Any], dict], session: Session, format: str):
+    try:
+        # yield_per turns on server-side cursors, so rows are fetched in batches instead of all at once.
+        rows = query.with_session(session).yield_per(STREAM_BATCH_SIZE)
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = None
+            for row in rows:
+                item = serialize(row)
+                if writer is None:
+                    writer = csv.DictWriter(buffer, fieldnames=list(item))
+                    writer.writeheader()
+                writer.writerow(item)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        else:
+            for row in rows:
+                yield orjson.dumps(serialize(row), default=str, option=orjson.OPT_APPEND_NEWLINE)
+    finally:
+        session.close()
+
+
+def stream_response(db: Session, query, serialize: Callable[[Any], dict], format: str = "ndjson") -> StreamingResponse:
+    # The stream outlives the request, so it gets its own session on the same bind.
+    return StreamingResponse(
+        _stream_rows(query, serialize, Session(bind=db.get_bind()), format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson"
+    )
+
+
+def list_response(db: Session, query, id_column, serialize: Callable[[Any], dict], page: PageParams,
+                  cursor_of: Callable[[Any], int] = lambda row: row.id):
+    """The page (or stream) of `query` that `page` asks for.
+
+    Pages are returned as an ORJSONResponse, so FastAPI doesn't run jsonable_encoder over every
+    row; orjson encodes datetimes itself, so `serialize` can leave them as they are.
+    """
+    query = query.filter(id_column > page.after).order_by(id_column)
+
+    if page.format == "ndjson":
+        return stream_response(db, query, serialize)
+
+    if page.limit:
+        query = query.limit(page.limit)
+    rows = query.all()
+    response = ORJSONResponse([serialize(row) for row in rows])
+    if page.limit and len(rows) == page.limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(cursor_of(rows[-1]))
+    return response
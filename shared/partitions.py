@@ -0,0 +1,176 @@
+"""Monthly partitions of the messages table.
+
+Usage:
+    python -m shared.partitions create [--ahead N]
+    python -m shared.partitions archive [--retention N] [--dir PATH] [--keep]
+
+`create` makes sure the current month and the next N have a partition; run it at least monthly
+(e.g. from cron) so inserts never land in messages_default. `archive` writes every partition that
+ended more than N months ago to PATH/messages_YYYY_MM.jsonl.gz and then detaches and drops it.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import text, true
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+import argparse
+import gzip
+import json
+import os
+import re
+
+from shared.models import Message
+
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3"))
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "12"))
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive")
+# Conversation and message timestamps come from different processes' clocks.
+PRUNE_MARGIN = timedelta(days=1)
+
+_PARTITION_NAME = re.compile(r"^messages_(\d{4})_(\d{2})$")
+
+
+def messages_since(started_at: Optional[datetime]):
+    """Lower bound on Message.timestamp for a conversation started at `started_at`.
+
+    No message predates its conversation, so adding this to a conversation_id filter changes no
+    result but lets Postgres skip every older monthly partition.
+    """
+    if started_at is None:
+        return true()
+    return Message.timestamp >= started_at - PRUNE_MARGIN
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"messages_{month:%Y_%m}"
+
+
+_COLUMNS = "id, conversation_id, role, content, timestamp"
+
+
+def create_partition(db: Session, month: date):
+    """Create the partition for `month`, moving in any of its rows that already sit in messages_default.
+
+    Postgres refuses to create a partition while the default one holds rows for its range, so
+    then the default is detached, the rows are moved into the new table and both are attached
+    again, all in one transaction.
+    """
+    name = partition_name(month)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+    bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_range = f"timestamp >= '{month.isoformat()}' AND timestamp < '{add_months(month, 1).isoformat()}'"
+    if not db.execute(text(f"SELECT EXISTS (SELECT 1 FROM messages_default WHERE {in_range})")).scalar():
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF messages {bounds}"))
+        return
+    db.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.execute(text("ALTER TABLE messages DETACH PARTITION messages_default"))
+    db.execute(text(
+        f"WITH moved AS (DELETE FROM messages_default WHERE {in_range} RETURNING {_COLUMNS}) "
+        f"INSERT INTO {name} ({_COLUMNS}) SELECT {_COLUMNS} FROM moved"
+    ))
+    # Attaching creates the partitioned indexes (and primary key) on the new table.
+    db.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} {bounds}"))
+    db.execute(text("ALTER TABLE messages ATTACH PARTITION messages_default DEFAULT"))
+
+
+def create_partitions(db: Session, ahead: int = MESSAGE_PARTITIONS_AHEAD) -> List[str]:
+    current = date.today().replace(day=1)
+    names = []
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        # Committed month by month, so one failure doesn't roll back the partitions already made.
+        try:
+            create_partition(db, month)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"Warning: could not create {partition_name(month)}: {getattr(e, 'orig', e)}")
+            continue
+        names.append(partition_name(month))
+    return names
+
+
+def list_partitions(db: Session) -> List[Tuple[str, date]]:
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'messages'::regclass"
+    )).scalars()
+    partitions = []
+    for name in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _export(db: Session, name: str, path: str) -> int:
+    partial = path + ".partial"
+    count = 0
+    result = db.execute(
+        text(f"SELECT id, conversation_id, role, content, timestamp FROM {name} ORDER BY id"),
+        execution_options={"yield_per": 1000}
+    )
+    with gzip.open(partial, "wt", encoding="utf-8") as archive:
+        for row in result:
+            archive.write(json.dumps({
+                "id": row.id,
+                "conversation_id": row.conversation_id,
+                "role": row.role,
+                "content": row.content,
+                "timestamp": row.timestamp.isoformat()
+            }) + "\n")
+            count += 1
+        archive.flush()
+        os.fsync(archive.fileno())
+    os.replace(partial, path)
+    return count
+
+
+def archive_partitions(db: Session, retention: int = MESSAGE_RETENTION_MONTHS,
+                       directory: str = MESSAGE_ARCHIVE_DIR, keep: bool = False) -> List[Tuple[str, int]]:
+    cutoff = add_months(date.today().replace(day=1), -retention)
+    os.makedirs(directory, exist_ok=True)
+    archived = []
+    for name, month in list_partitions(db):
+        if add_months(month, 1) > cutoff:
+            continue
+        count = _export(db, name, os.path.join(directory, f"{name}.jsonl.gz"))
+        # Only drop the rows once the archive is safely on disk.
+        db.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        if not keep:
+            db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        archived.append((name, count))
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of the messages table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Create partitions for this month and the next ones.")
+    create.add_argument("--ahead", type=int, default=MESSAGE_PARTITIONS_AHEAD)
+    archive = commands.add_parser("archive", help="Archive and drop partitions older than the retention.")
+    archive.add_argument("--retention", type=int, default=MESSAGE_RETENTION_MONTHS)
+    archive.add_argument("--dir", default=MESSAGE_ARCHIVE_DIR)
+    archive.add_argument("--keep", action="store_true", help="Detach the partitions but don't drop them.")
+    args = parser.parse_args()
+
+    from shared.database import SessionLocal
+
+    with SessionLocal() as db:
+        if args.command == "create":
+            for name in create_partitions(db, args.ahead):
+                print(f"{name} ready")
+        else:
+            for name, count in archive_partitions(db, args.retention, args.dir, args.keep):
+                print(f"{name}: {count} messages archived")
+
+
+if __name__ == "__main__":
+    main()
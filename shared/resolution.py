@@ -0,0 +1,207 @@
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from sqlalchemy import and_, literal, select, union_all, true, false
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from shared.models import Client, User, Conversation
+
+
+@dataclass(frozen=True)
+class Resolution:
+    user_id: int
+    username: str
+    client_id: int
+    client_code: str
+    client_name: str
+    conversation_id: Optional[int] = None
+    # Lower bound for the conversation's message timestamps; lets queries skip old partitions.
+    conversation_started_at: Optional[datetime] = None
+
+
+def _upsert_conversation(user, day: date, now: datetime):
+    """CTE yielding (id, created_at, created) for `user`'s conversation of `day`, inserting it if missing.
+
+    `user` must expose id, client_id and username columns. Within one statement the plain SELECT
+    cannot see the row the INSERT adds, so exactly one side of the UNION returns it.
+    """
+    inserted = insert(Conversation).from_select(
+        ["user_id", "client_id", "title", "conversation_date", "created_at", "updated_at"],
+        select(user.c.id, user.c.client_id,
+               literal("Conversación ") + user.c.username + literal(day.strftime(" - %d/%m/%Y")),
+               literal(day), literal(now), literal(now))
+    ).on_conflict_do_nothing(
+        constraint="uq_conversations_user_id_conversation_date"
+    ).returning(Conversation.id, Conversation.created_at).cte("inserted_conversation")
+
+    existing = select(Conversation.id, Conversation.created_at, false().label("created")).join(
+        user, Conversation.user_id == user.c.id
+    ).where(Conversation.conversation_date == day)
+
+    return union_all(
+        select(inserted.c.id, inserted.c.created_at, true().label("created")), existing
+    ).cte("conversation")
+
+
+def resolution_statement(client_code: str, username: str, day: Optional[date] = None,
+                         active_only: bool = False):
+    """One statement that finds the client, upserts the user and, given `day`, that day's conversation.
+
+    Returns no row when the client does not exist (or is inactive with `active_only`), or when a
+    concurrent transaction inserted the same user/conversation after this statement's snapshot.
+    """
+    now = datetime.utcnow()
+
+    client = select(Client.id, Client.client_code, Client.name).where(Client.client_code == client_code)
+    if active_only:
+        client = client.where(Client.status == 'Activo')
+    client = client.cte("client")
+
+    inserted_user = insert(User).from_select(
+        ["username", "client_id", "status", "created_at"],
+        select(literal(username), client.c.id, literal("Activo"), literal(now))
+    ).on_conflict_do_nothing(
+        constraint="uq_users_client_id_username"
+    ).returning(User.id, User.client_id, User.username).cte("inserted_user")
+
+    existing_user = select(User.id, User.client_id, User.username, false().label("created")).join(
+        client, User.client_id == client.c.id
+    ).where(User.username == username)
+
+    user = union_all(
+        select(inserted_user.c.id, inserted_user.c.client_id, inserted_user.c.username, true().label("created")),
+        existing_user
+    ).cte("resolved_user")
+
+    columns = [user.c.id.label("user_id"), user.c.username, user.c.client_id, client.c.client_code,
+               client.c.name.label("client_name"), user.c.created]
+    if day is None:
+        return select(*columns).select_from(user).join(client, user.c.client_id == client.c.id)
+
+    conversation = _upsert_conversation(user, day, now)
+    return select(*columns, conversation.c.id.label("conversation_id"),
+                  conversation.c.created_at.label("conversation_started_at"),
+                  conversation.c.created.label("conversation_created")).select_from(user).join(
+        client, user.c.client_id == client.c.id
+    ).join(conversation, true())
+
+
+def lookup_statement(client_code: str, username: str, day: Optional[date] = None, active_only: bool = False):
+    """Plain read of what resolution_statement would upsert, with a NULL conversation_id if `day`'s is missing.
+
+    Tried first: an INSERT ... ON CONFLICT DO NOTHING draws a sequence value even when the row
+    exists, so running the upsert on every resolve would burn through the int4 ids.
+    """
+    statement = select(User.id.label("user_id"), User.username, User.client_id, Client.client_code,
+                       Client.name.label("client_name")).join(
+        Client, User.client_id == Client.id
+    ).where(Client.client_code == client_code, User.username == username)
+    if active_only:
+        statement = statement.where(Client.status == 'Activo')
+    if day is not None:
+        statement = statement.add_columns(
+            Conversation.id.label("conversation_id"), Conversation.created_at.label("conversation_started_at")
+        ).outerjoin(Conversation, and_(Conversation.user_id == User.id, Conversation.conversation_date == day))
+    return statement
+
+
+def today_conversation_statement(user_id: int, day: date):
+    """Upsert `user_id`'s conversation for `day`; returns (id, created_at, created), or no row for an unknown user."""
+    user = select(User.id, User.client_id, User.username).where(User.id == user_id).cte("resolved_user")
+    return select(_upsert_conversation(user, day, datetime.utcnow()))
+
+
+def _resolution(row) -> Resolution:
+    return Resolution(
+        user_id=row.user_id,
+        username=row.username,
+        client_id=row.client_id,
+        client_code=row.client_code,
+        client_name=row.client_name,
+        conversation_id=getattr(row, "conversation_id", None),
+        conversation_started_at=getattr(row, "conversation_started_at", None),
+    )
+
+
+def _created(row) -> bool:
+    return row.created or getattr(row, "conversation_created", False)
+
+
+def _with_conversation(resolved: Resolution, conversation) -> Resolution:
+    return replace(resolved, conversation_id=conversation.id, conversation_started_at=conversation.created_at)
+
+
+def resolve(db: Session, client_code: str, username: str, day: Optional[date] = None,
+            active_only: bool = False) -> Optional[Resolution]:
+    """Resolve (and create if needed) the user and optionally the conversation of `day`.
+
+    Commits only when a row was inserted. Returns None when the client does not exist.
+    """
+    found = db.execute(lookup_statement(client_code, username, day, active_only)).first()
+    if found is not None:
+        if day is None or found.conversation_id is not None:
+            return _resolution(found)
+        # Known user, first message of the day: only the conversation needs inserting.
+        conversation = _today_conversation(db, found.user_id, day)
+        if conversation is not None:
+            return _with_conversation(_resolution(found), conversation)
+
+    statement = resolution_statement(client_code, username, day, active_only)
+    row = db.execute(statement).first()
+    if row is None:
+        # Either the client is missing or a concurrent insert won the race; that row is committed now.
+        row = db.execute(statement).first()
+        if row is None:
+            return None
+    if _created(row):
+        db.commit()
+    return _resolution(row)
+
+
+async def resolve_async(db: AsyncSession, client_code: str, username: str, day: Optional[date] = None,
+                        active_only: bool = False) -> Optional[Resolution]:
+    found = (await db.execute(lookup_statement(client_code, username, day, active_only))).first()
+    if found is not None:
+        if day is None or found.conversation_id is not None:
+            return _resolution(found)
+        conversation = await _today_conversation_async(db, found.user_id, day)
+        if conversation is not None:
+            return _with_conversation(_resolution(found), conversation)
+
+    statement = resolution_statement(client_code, username, day, active_only)
+    row = (await db.execute(statement)).first()
+    if row is None:
+        row = (await db.execute(statement)).first()
+        if row is None:
+            return None
+    if _created(row):
+        await db.commit()
+    return _resolution(row)
+
+
+def _today_conversation(db: Session, user_id: int, day: date):
+    statement = today_conversation_statement(user_id, day)
+    row = db.execute(statement).first() or db.execute(statement).first()
+    if row is not None and row.created:
+        db.commit()
+    return row
+
+
+async def _today_conversation_async(db: AsyncSession, user_id: int, day: date):
+    statement = today_conversation_statement(user_id, day)
+    row = (await db.execute(statement)).first() or (await db.execute(statement)).first()
+    if row is not None and row.created:
+        await db.commit()
+    return row
+
+
+def resolve_today_conversation(db: Session, user_id: int, day: date) -> Optional[int]:
+    existing = db.execute(select(Conversation.id).where(
+        Conversation.user_id == user_id, Conversation.conversation_date == day
+    )).scalar()
+    if existing is not None:
+        return existing
+    row = _today_conversation(db, user_id, day)
+    return row.id if row is not None else None
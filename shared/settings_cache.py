@@ -0,0 +1,70 @@
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+import asyncio
+import time
+import os
+
+from shared.models import Setting
+from shared.notify import notify
+
+SETTINGS_CHANNEL = "settings_changed"
+SETTINGS_CACHE_REFRESH = float(os.getenv("SETTINGS_CACHE_REFRESH", "30"))
+
+
+def notify_settings_changed(db: Session):
+    notify(db, SETTINGS_CHANNEL)
+
+
+class SettingsCache:
+    """All Setting rows held in memory.
+
+    A NOTIFY on SETTINGS_CHANNEL marks the cache stale immediately; independently, every
+    SETTINGS_CACHE_REFRESH seconds a cheap max(updated_at)/count() probe detects writes from
+    workers whose notifications were missed.
+    """
+
+    def __init__(self, refresh_interval: float = SETTINGS_CACHE_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._values: Dict[str, str] = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, payload: Optional[str] = None):
+        self._stale = True
+
+    async def get(self, db: AsyncSession, key: str, default: Optional[str] = None) -> Optional[str]:
+        await self._ensure_fresh(db)
+        return self._values.get(key, default)
+
+    async def get_many(self, db: AsyncSession, *keys: str) -> Dict[str, Optional[str]]:
+        await self._ensure_fresh(db)
+        return {key: self._values.get(key) for key in keys}
+
+    async def _ensure_fresh(self, db: AsyncSession):
+        if not self._stale and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if not self._stale and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+            # Cleared before reading so a NOTIFY that lands mid-reload marks the cache stale again.
+            stale = self._stale
+            self._stale = False
+            try:
+                version = tuple((await db.execute(
+                    select(func.max(Setting.updated_at), func.count(Setting.id))
+                )).one())
+                if stale or version != self._version:
+                    rows = await db.execute(select(Setting.key, Setting.value))
+                    self._values = {key: value for key, value in rows}
+                    self._version = version
+            except Exception:
+                self._stale = True
+                raise
+            self._checked_at = time.monotonic()
+
+
+settings_cache = SettingsCache()
@@ -0,0 +1,55 @@
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List
+import os
+
+from shared.models import Client, Attribute, User
+
+# Rows per INSERT statement; keeps bind parameters well under Postgres' 65535 limit.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+
+def _chunks(rows: List[dict], size: int) -> Iterable[List[dict]]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def upsert_clients(db: Session, rows: List[Dict]) -> int:
+    count = 0
+    for chunk in _chunks(rows, BULK_CHUNK_SIZE):
+        stmt = insert(Client).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Client.client_code],
+            set_={"name": stmt.excluded.name, "status": stmt.excluded.status}
+        )
+        count += db.execute(stmt).rowcount
+    return count
+
+
+def upsert_attributes(db: Session, rows: List[Dict]) -> int:
+    """Insert or update (client_id, template_id, value) rows in multi-row statements."""
+    # ON CONFLICT cannot touch the same row twice in one statement; the last value for a pair wins.
+    rows = list({(row["client_id"], row["template_id"]): row for row in rows}.values())
+    count = 0
+    now = datetime.utcnow()
+    for chunk in _chunks(rows, BULK_CHUNK_SIZE):
+        stmt = insert(Attribute).values([{**row, "updated_at": now} for row in chunk])
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_attributes_client_id_template_id",
+            set_={"value": stmt.excluded.value, "updated_at": now}
+        )
+        count += db.execute(stmt).rowcount
+    return count
+
+
+def upsert_users(db: Session, rows: List[Dict]) -> int:
+    count = 0
+    for chunk in _chunks(rows, BULK_CHUNK_SIZE):
+        stmt = insert(User).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_users_client_id_username",
+            set_={"status": stmt.excluded.status}
+        )
+        count += db.execute(stmt).rowcount
+    return count
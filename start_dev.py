@@ -44,6 +44,14 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
 
     print("🏗️ Iniciando sistema de agente...")
+
+    print("🗄️ Aplicando migraciones de base de datos...")
+    if subprocess.run("alembic upgrade head", shell=True).returncode != 0:
+        print("❌ Error aplicando migraciones")
+        sys.exit(1)
+    if subprocess.run(f"{sys.executable} -m shared.partitions create", shell=True).returncode != 0:
+        print("❌ Error creando las particiones de mensajes")
+        sys.exit(1)
     print("Presiona Ctrl+C para detener todos los servicios\n")
 
     services = [